@@ -0,0 +1,398 @@
+import math
+
+import pandas as pd
+import seaborn as sns
+import matplotlib.pyplot as plt
+import numpy as np
+from scipy.signal import lfilter
+
+from Discretizer import Discretizer
+from AgentState import AgentState
+from Exploration import RandomStreams
+from FlappyBirdSim import STATE_RANGES
+from QTable import DenseQTable, HashedQTable
+from ReplayBuffer import ReplayBuffer, qLearningUpdate
+
+# reward schemes (see reward_values)
+REWARDS = {"positive": 1.0, "tick": 0.0, "loss": -5.0}
+SCALED_REWARDS = {"positive": 100.0, "tick": 1.0, "loss": -1000.0}
+
+# update rules
+Q_LEARNING = 'q-learning'
+MONTE_CARLO = 'monte-carlo'
+
+
+class TabularAgent(AgentState):
+    """ The tabular agents (QLearingAgent and its variants, AgentBest,
+        QLearingAgentTest, MCAgent, MCAgentDynamicAlpha, QLearingAgentHashed)
+        are configurations of this class: a subclass sets the class
+        attributes below and is completed with the tabular decorator.
+        QLambdaAgent and DynaQAgent are subclasses of QLearingAgent with an
+        observeFeatures of their own.
+
+        - discretizer: stateSpec (see Discretizer)
+        - q-store: qStore makes the q-table from stateBounds, a DenseQTable
+          or a HashedQTable (keyed by the packed state instead of an index)
+        - update rule: update, Q_LEARNING (optionally with experience
+          replay) or MONTE_CARLO (first visit, at the end of each episode),
+          None for a subclass that defines observeFeatures itself
+        - alpha schedule: alphaSchedule(alpha, episodes) returns the alpha
+          to use after episodes episodes, None keeps alpha constant, every
+          change is printed when printAlpha is set
+        - reward scheme: rewardValues, returned by reward_values
+
+        tabular picks the code of the update rule and the q-store once, so
+        every step runs a single function without checking the configuration.
+        Every agent makes its own q-table (and the steps of its episode for
+        MONTE_CARLO), see AgentState.
+    """
+    alpha = 0.1
+    gamma = 1
+    epsilon = 0.1
+    # frames each decision lasts (see Run.train_game), gamma is per frame
+    actionRepeat = 1
+
+    rewardValues = REWARDS
+    update = Q_LEARNING
+    alphaSchedule = None
+    printAlpha = False
+    qStore = DenseQTable
+    # components of the discretized state (see Discretizer) and their ranges,
+    # which have to hold every state of the game (see tabular)
+    stateSpec = None
+    stateBounds = None
+    _episodeCount = 0
+
+    # experience replay of Q_LEARNING with a DenseQTable, off while
+    # replayCapacity is 0: every replayEvery frames a minibatch of
+    # replayBatchSize stored transitions is learned again
+    replayCapacity = 0
+    replayBatchSize = 32
+    replayEvery = 1
+    _replay = None
+    _replayCount = 0
+
+    # whether observe relies on two subsequent calls being from the same
+    # episode (see Run.train_game_vectorized), set by tabular for MONTE_CARLO
+    orderedEpisodes = False
+
+    # the last state observe featurized and its features: the framework
+    # passes the s2 of observe to the next training_policy/policy and as the
+    # s1 of the next observe, so every state is featurized once. The game
+    # returns a new dict every frame, the states are never changed.
+    _lastState = None
+    _lastFeatures = None
+
+    def __init__(self, seed=42):
+        # epsilon-greedy and tie-breaks, see Exploration
+        self._random = RandomStreams(seed)
+
+        self._q = self.qStore(self.stateBounds)
+        if self.update == MONTE_CARLO:
+            # the steps of the current episode: flat q-table index (state and
+            # action) and reward, grown by doubling when an episode gets longer
+            self._stepIndices = np.zeros(1024, dtype=np.int64)
+            self._stepRewards = np.zeros(1024)
+            self._stepCount = 0
+        return
+
+    def reward_values(self):
+        """ returns the reward values used for training
+
+            Note: These are only the rewards used for training.
+            The rewards used for evaluating the agent will always be
+            1 for passing through each pipe and 0 for all other state
+            transitions.
+        """
+        return dict(self.rewardValues)
+
+    def observe(self, s1, a, r, s2, end):
+        """ this function is called during training on each step of the game where
+            the state transition is going from state s1 with action a to state s2 and
+            yields the reward r. If s2 is a terminal state, end==True, otherwise end==False.
+
+            Unless a terminal state was reached, two subsequent calls to observe will be for
+            subsequent steps in the same episode. That is, s1 in the second call will be s2
+            from the first call.
+            """
+        f1 = self._lastFeatures if s1 is self._lastState else self.featurize(s1)
+        f2 = None
+        if not end:
+            f2 = self.featurize(s2)
+            self._lastState = s2
+            self._lastFeatures = f2
+        self.observeFeatures(f1, a, r, f2, end)
+
+    def _qLearningStep(self, f1, a, r, f2, end):
+        """ observeFeatures of Q_LEARNING with a DenseQTable """
+        q = self._q
+        flat = q.flat
+        i1 = f1 + a
+
+        currentQ = flat[i1]
+        maxNextQ = 0
+        i2 = 0
+        if not end:
+            i2 = f2
+            qS2A0 = flat[i2]
+            qS2A1 = flat[i2 + 1]
+            if(qS2A0 > qS2A1):
+                maxNextQ = qS2A0
+            else:
+                maxNextQ = qS2A1
+        newQ = currentQ + self.alpha * (r + self.gamma ** self.actionRepeat * maxNextQ - currentQ)
+
+        # q.write, inlined
+        flat[i1] = newQ
+        q.visited[i1 >> 1] = 1
+
+        if self.replayCapacity:
+            if self._replay is None:
+                self._replay = ReplayBuffer(self.replayCapacity, rng=self._random.rng.randint(2 ** 31))
+            self._replay.add(i1 - a, a, r, i2, end)
+            self._replayCount += 1
+            if self._replayCount % self.replayEvery == 0 and len(self._replay) >= self.replayBatchSize:
+                qLearningUpdate(q, self._replay.sample(self.replayBatchSize), self.alpha, self.gamma ** self.actionRepeat)
+
+        if end and self.alphaSchedule is not None:
+            self._episodeDone()
+        return
+
+    def _hashedQLearningStep(self, f1, a, r, f2, end):
+        """ observeFeatures of Q_LEARNING with a HashedQTable """
+        q = self._q
+        flat = q.flat
+
+        maxNextQ = 0
+        if not end:
+            # the first probe of q.find, inlined
+            slot = f2 % q.size
+            k = q._keys[slot]
+            i2 = 2 * slot if k == f2 else (q.missing if k == -1 else q.find(f2))
+            qS2A0 = flat[i2]
+            qS2A1 = flat[i2 + 1]
+            if(qS2A0 > qS2A1):
+                maxNextQ = qS2A0
+            else:
+                maxNextQ = qS2A1
+        # q.write, with the probe sequence of f1 walked only once
+        i1 = q.writeIndex(f1) + a
+        currentQ = flat[i1]
+        flat[i1] = currentQ + self.alpha * (r + self.gamma ** self.actionRepeat * maxNextQ - currentQ)
+
+        if end and self.alphaSchedule is not None:
+            self._episodeDone()
+        return
+
+    def _monteCarloStep(self, f1, a, r, f2, end):
+        """ observeFeatures of MONTE_CARLO with a DenseQTable """
+        n = self._stepCount
+        if n == len(self._stepIndices):
+            self._stepIndices = np.concatenate((self._stepIndices, np.zeros_like(self._stepIndices)))
+            self._stepRewards = np.concatenate((self._stepRewards, np.zeros_like(self._stepRewards)))
+        self._stepIndices[n] = f1 + a
+        self._stepRewards[n] = r
+        self._stepCount = n + 1
+
+        if not end:
+            return
+
+        # returns of all steps in one backward pass: g[t] = r[t] + gamma * g[t+1]
+        g = lfilter([1.0], [1.0, -self.gamma ** self.actionRepeat], self._stepRewards[n::-1])[::-1]
+        # every state-action pair is updated with the return of its first visit
+        indices, firstIdx = np.unique(self._stepIndices[:n + 1], return_index=True)
+        qValues = self._q.values[indices]
+        self._q.writeMany(indices, qValues + self.alpha * (g[firstIdx] - qValues))
+
+        self._stepCount = 0
+        if self.alphaSchedule is not None:
+            self._episodeDone()
+        return
+
+    def _episodeDone(self):
+        self._episodeCount += 1
+        alpha = self.alphaSchedule(self.alpha, self._episodeCount)
+        if alpha != self.alpha:
+            self.alpha = alpha
+            if self.printAlpha:
+                print "new alpha: %f" % self.alpha
+
+    def training_policy(self, state):
+        """ Returns the index of the action that should be done in state while training the agent.
+            Possible actions in Flappy Bird are 0 (flap the wing) or 1 (do nothing).
+
+            training_policy is called once per frame in the game while training
+        """
+        return self.trainingPolicyFeatures(self._lastFeatures if state is self._lastState else self.featurize(state))
+
+    def trainingPolicyFeatures(self, f):
+        """ training_policy for the features of the state (see featurize) """
+        if self.epsilon > self._random.uniform():
+            return self._random.bit()
+        return self.policyFeatures(f)
+
+    def policy(self, state):
+        """ Returns the index of the action that should be done in state when training is completed.
+            Possible actions in Flappy Bird are 0 (flap the wing) or 1 (do nothing).
+
+            policy is called once per frame in the game (30 times per second in real-time)
+            and needs to be sufficiently fast to not slow down the game.
+        """
+        return self.policyFeatures(self._lastFeatures if state is self._lastState else self.featurize(state))
+
+    def _policyStep(self, f):
+        """ policyFeatures with a DenseQTable """
+        flat = self._q.flat
+        qAction0 = flat[f]
+        qAction1 = flat[f + 1]
+
+        if qAction0 == qAction1:
+            return self._random.bit()
+        if qAction0 > qAction1:
+            return 0
+        return 1
+
+    def _hashedPolicyStep(self, f):
+        """ policyFeatures with a HashedQTable, states that are not in the
+            table are not added to it
+        """
+        q = self._q
+        # the first probe of q.find, inlined
+        slot = f % q.size
+        k = q._keys[slot]
+        i = 2 * slot if k == f else (q.missing if k == -1 else q.find(f))
+        qAction0 = q.flat[i]
+        qAction1 = q.flat[i + 1]
+
+        if qAction0 == qAction1:
+            return self._random.bit()
+        if qAction0 > qAction1:
+            return 0
+        return 1
+
+    def plotQ(self, what='v'):
+        # This function assumes that q = { (s, [q(s,flap), q(s,noop)]) ,... },
+        # that is, q is a dictionary where each entry is mapping from a state to
+        # an array of q-values.
+        # States are encoded as tuples with the (discretized versions of) the
+        # components of stateSpec, the keys of a HashedQTable are unpacked
+        # first.
+        #
+        # "what" defines which value is plotted and can be one of 'q_flap',
+        # 'q_noop', 'v' or 'pi'
+
+        # turn q into a list of records, one for each state
+        hashed = isinstance(self._q, HashedQTable)
+        if hashed:
+            data = [self.unpackKey(key) + tuple(values) for key, values in self._q.items()]
+        else:
+            data = [s + tuple(self._q[s]) for s in self._q.keys()]
+        # turn this into a dataframe, giving the columns the right names
+        df = pd.DataFrame(data=data, columns=self._discretizer.names + ('q_flap', 'q_noop'))
+        # add a few more columns that might come in handy
+        if 'delta_y' not in df:
+            df['delta_y'] = df['player_y'] - df['next_pipe_top_y']
+        df['v'] = df[['q_noop', 'q_flap']].max(axis=1)
+        df['pi'] = (df[['q_noop', 'q_flap']].idxmax(axis=1) == 'q_flap') * 1
+        # group entries that have the same 'delta_y' and 'next_pipe_dist_to_player',
+        # by taking the mean of the remaining values
+        df = df.groupby(
+            ['delta_y', 'next_pipe_dist_to_player'], as_index=False).mean()
+
+        plt.figure()
+        if what in ('q_flap', 'q_noop', 'v'):
+            # for estimated values, use a range of -5 to 5 (the fine states of
+            # a HashedQTable are too many to annotate)
+            ax = sns.heatmap(
+                df.pivot('delta_y', 'next_pipe_dist_to_player', what),
+                vmin=-5, vmax=5, cmap='coolwarm', annot=not hashed, fmt='.2f')
+        elif what == 'pi':
+            # for the policy, use a range of 0 to 1
+            ax = sns.heatmap(
+                df.pivot('delta_y', 'next_pipe_dist_to_player', 'pi'),
+                vmin=0, vmax=1, cmap='coolwarm')
+        # invert the x axis such that states further from the next pipe are on the
+        # left and states closer to the next pipe are on the right
+        ax.invert_xaxis()
+        ax.set_title(what)
+        plt.show()
+
+
+def tabular(cls):
+    """ class decorator completing a configuration of TabularAgent: builds
+        its Discretizer and picks the observeFeatures and policyFeatures of
+        its update rule and q-store
+    """
+    cls._discretizer = Discretizer(cls.stateSpec)
+    cls.discretizeState = staticmethod(cls._discretizer.discretize)
+
+    # the agents make their own tables, this one only shows the kind of
+    # table and the layout the features are computed for
+    q = cls.qStore(cls.stateBounds)
+    if isinstance(q, HashedQTable):
+        if cls.update != Q_LEARNING:
+            raise ValueError("%s: a HashedQTable only supports %s" % (cls.__name__, Q_LEARNING))
+        stateKey, unpackKey = cls._discretizer.packer()
+        cls.stateKey = staticmethod(stateKey)
+        cls.unpackKey = staticmethod(unpackKey)
+        # the features of a state passed to the *Features methods (see Run.train_game)
+        cls.featurize = staticmethod(stateKey)
+        cls.observeFeatures = TabularAgent._hashedQLearningStep.im_func
+        cls.policyFeatures = TabularAgent._hashedPolicyStep.im_func
+        return cls
+
+    # a state outside of the bounds would silently alias another cell
+    cls._discretizer.checkBounds(q.bounds, STATE_RANGES)
+    stateIndex = cls._discretizer.indexer(q)
+    cls.stateIndex = staticmethod(stateIndex)
+    cls.featurize = staticmethod(stateIndex)
+    if cls.update is None:
+        if not hasattr(cls, 'observeFeatures'):
+            raise ValueError("%s: update None needs an observeFeatures" % cls.__name__)
+    elif cls.update == Q_LEARNING:
+        cls.observeFeatures = TabularAgent._qLearningStep.im_func
+    elif cls.update == MONTE_CARLO:
+        cls.observeFeatures = TabularAgent._monteCarloStep.im_func
+        cls.orderedEpisodes = True
+    else:
+        raise ValueError("%s: unknown update rule %r" % (cls.__name__, cls.update))
+    cls.policyFeatures = TabularAgent._policyStep.im_func
+    return cls
+
+
+def _decade(episodes, after):
+    """ c if episodes is 10 ** c for an integer c > after, else None """
+    decimalNumbers = math.log(episodes, 10)
+    decimalNumbersCeiled = math.ceil(decimalNumbers)
+    if decimalNumbers > after and decimalNumbersCeiled - decimalNumbers < 0.000000000000001:
+        return decimalNumbersCeiled
+    return None
+
+
+def decayPerDecade(alpha, episodes):
+    """ alpha scaled by 10 ** (2 - c) after 10 ** c episodes, c > 2 """
+    c = _decade(episodes, 2)
+    if c is None:
+        return alpha
+    return alpha * 10 ** (-c + 2)
+
+
+def alphaPerDecade(alpha, episodes):
+    """ alpha 10 ** (2 - c) after 10 ** c episodes, c > 2 """
+    c = _decade(episodes, 2)
+    if c is None:
+        return alpha
+    return 1 * 10 ** (-c + 2)
+
+
+def monteCarloAlphaPerDecade(alpha, episodes):
+    """ alpha 10 ** (-c + 100 ** -c), about 10 ** -c, after 10 ** c episodes, c > 1 """
+    c = _decade(episodes, 1)
+    if c is None:
+        return alpha
+    return 10 ** (-c + 100 ** (-c))
+
+
+def stepAlpha(steps):
+    """ the schedule that sets alpha to steps[n] after n episodes """
+    return lambda alpha, episodes: steps.get(episodes, alpha)
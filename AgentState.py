@@ -0,0 +1,41 @@
+import copy
+
+# the hyperparameters state_dict always includes, also while an agent still
+# has the values of its class
+HYPERPARAMETERS = ('alpha', 'gamma', 'epsilon', 'actionRepeat')
+
+
+class AgentState:
+    """ clone, state_dict and load_state_dict of the agents.
+
+        Everything an agent learns (its q-table or weights, traces, model,
+        random streams, episode count and the hyperparameters it changed) is
+        kept in attributes of the instance, the class attributes are only the
+        configuration and initial values. So any number of agents can train
+        in one process, one after the other or interleaved (e.g. in threads,
+        each with its own Run.train_game and scores), without sharing state.
+    """
+
+    def state_dict(self):
+        """ a deep copy of the learning state of the agent, as a dict of its
+            instance attributes
+        """
+        state = copy.deepcopy(self.__dict__)
+        for name in HYPERPARAMETERS:
+            if hasattr(self, name):
+                state.setdefault(name, getattr(self, name))
+        return state
+
+    def load_state_dict(self, state):
+        """ replaces the learning state of the agent by a copy of state (see
+            state_dict) of an agent of the same class
+        """
+        state = copy.deepcopy(state)
+        self.__dict__.clear()
+        self.__dict__.update(state)
+
+    def clone(self):
+        """ an independent copy of the agent that continues exactly like the
+            agent would, including its random numbers
+        """
+        return copy.deepcopy(self)
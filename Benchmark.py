@@ -0,0 +1,217 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+from FlappyBirdSim import STATE_KEYS, VectorFlappyBird
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BenchmarkTrace.npz')
+
+# (module, class) of every agent, imported in the worker processes
+AGENTS = (
+    ('QLearningAgent', 'QLearingAgent'),
+    ('QLearningAgentHashed', 'QLearingAgentHashed'),
+    ('QLearningAgentOptimizedReward', 'QLearingAgentOptimizedReward'),
+    ('QLearningAgentOptimizedGamma', 'QLearingAgentOptimizedGamma'),
+    ('QLearningAgentDynamicAlpha', 'QLearingAgentDynamicAlpha'),
+    ('QLearningAgentOptimizedState', 'QLearingAgentOptimizedState'),
+    ('AgentBest', 'AgentBest'),
+    ('test', 'QLearingAgentTest'),
+    ('MonteCarloAgent', 'MCAgent'),
+    ('MCAgentDynamicAlpha', 'MCAgentDynamicAlpha'),
+    ('QLambdaAgent', 'QLambdaAgent'),
+    ('QLambdaAgent', 'SarsaLambdaAgent'),
+    ('DynaQAgent', 'DynaQAgent'),
+    ('LinearFunctionApproximation', 'LFA'),
+    ('LinearFunctionApproximationNonLinear', 'LFA'),
+)
+
+METHODS = ('discretizeState', 'featurize', 'policy', 'training_policy', 'observe', 'observeFeatures')
+
+
+def recordTrace(path=TRACE, nb_frames=5000, seed=0):
+    """ records nb_frames transitions (s1, action, reward, s2, end) of the
+        simulator with the rewards of the agents, played by a simple heuristic
+        (flap when below the gap) with 10% random actions so the games last
+        long enough to cover the states of a trained agent
+    """
+    rng = np.random.RandomState(seed)
+    sim = VectorFlappyBird(1, reward_values={"positive": 1.0, "tick": 0.0, "loss": -5.0}, rng=seed)
+    columns = dict((prefix + key, []) for prefix in ('s1_', 's2_') for key in STATE_KEYS)
+    actions, rewards, ends = [], [], []
+    for frame in range(nb_frames):
+        s1 = sim.getGameStates()[0]
+        action = 0 if s1['player_y'] > s1['next_pipe_bottom_y'] - 40 else 1
+        if rng.rand() < 0.1:
+            action = rng.randint(2)
+        reward, over = sim.step([action])
+        s2 = sim.getGameStates()[0]
+        for key in STATE_KEYS:
+            columns['s1_' + key].append(s1[key])
+            columns['s2_' + key].append(s2[key])
+        actions.append(action)
+        rewards.append(reward[0])
+        ends.append(over[0])
+        if over[0]:
+            sim.reset()
+    np.savez_compressed(path, actions=np.array(actions), rewards=np.array(rewards), ends=np.array(ends),
+                        **dict((name, np.array(values)) for name, values in columns.items()))
+
+
+def loadTrace(path=TRACE):
+    """ returns the recorded transitions as a list of (s1, a, r, s2, end) with
+        the states as plain dicts like getGameState() returns them
+    """
+    data = np.load(path)
+
+    def states(prefix):
+        columns = [data[prefix + key].tolist() for key in STATE_KEYS]
+        return [dict(zip(STATE_KEYS, values)) for values in zip(*columns)]
+
+    return list(zip(states('s1_'), data['actions'].tolist(), data['rewards'].tolist(), states('s2_'),
+                    data['ends'].tolist()))
+
+
+def _retainedObjects(call, data):
+    """ the objects tracked by the garbage collector (lists, dicts, tuples,
+        instances, not numbers or strings) the calls leave behind, per call,
+        from the number of objects gc.get_objects() returns before and after.
+        Python 2 has no tracemalloc, so objects that are freed again within
+        the calls and the bytes they take are not measured, peakMemoryKb is
+        the total growth of the process. It is measured after the timed
+        calls, on an agent that has already seen the trace.
+    """
+    gc.collect()
+    before = len(gc.get_objects())
+    call(data)
+    gc.collect()
+    return float(len(gc.get_objects()) - before) / len(data)
+
+
+def _benchmarkAgent(job):
+    """ times the hot methods of one agent class over the trace, in a fresh
+        worker process (so its peak memory is the agent's alone)
+    """
+    moduleName, className, path, repeat = job
+    import importlib
+    agentClass = getattr(importlib.import_module(moduleName), className)
+    transitions = loadTrace(path)
+    # LFA's theta diverges on the trace, which is fine for timing it
+    np.seterr(all='ignore')
+    baseMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    agent = agentClass()
+    random.seed(42)
+    np.random.seed(42)
+    features = [(agent.featurize(s1), a, r, None if end else agent.featurize(s2), end)
+                for s1, a, r, s2, end in transitions]
+
+    # every method is called once per transition, observe in the recorded order
+    calls = {
+        'discretizeState': lambda ts: [agent.discretizeState(t[0]) for t in ts],
+        'featurize': lambda ts: [agent.featurize(t[0]) for t in ts],
+        'policy': lambda ts: [agent.policy(t[0]) for t in ts],
+        'training_policy': lambda ts: [agent.training_policy(t[0]) for t in ts],
+        'observe': lambda ts: [agent.observe(*t) for t in ts],
+        'observeFeatures': lambda ts: [agent.observeFeatures(*t) for t in ts],
+    }
+    results = {}
+    for method in METHODS:
+        if not hasattr(agent, method):
+            continue
+        data = features if method == 'observeFeatures' else transitions
+        call = calls[method]
+        call(data)
+        seconds = min(timeit.repeat(lambda: call(data), number=1, repeat=repeat))
+        results[method] = {'nsPerCall': seconds / len(data) * 1e9,
+                           'retainedObjectsPerCall': _retainedObjects(call, data)}
+    return {'agent': '%s.%s' % (moduleName, className), 'methods': results,
+            'peakMemoryKb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseMemory}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(TRACE),
+                                       stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(path=TRACE, repeat=5, agents=AGENTS, processes=None):
+    """ benchmarks every agent class and returns the results (see main) """
+    if not os.path.exists(path):
+        recordTrace(path)
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    try:
+        agentResults = pool.map(_benchmarkAgent, [(m, c, path, repeat) for m, c in agents], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'transitions': len(np.load(path)['actions']),
+        'agents': dict((r['agent'], r) for r in agentResults),
+    }
+
+
+def compare(old, new, threshold=1.1):
+    """ returns the (agent, method, old ns, new ns) of all methods that are
+        slower than threshold times their time in old
+    """
+    regressions = []
+    for agent, result in sorted(new['agents'].items()):
+        if agent not in old['agents']:
+            continue
+        for method, timing in sorted(result['methods'].items()):
+            before = old['agents'][agent]['methods'].get(method)
+            if before is not None and timing['nsPerCall'] > threshold * before['nsPerCall']:
+                regressions.append((agent, method, before['nsPerCall'], timing['nsPerCall']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="times the agents' methods on the recorded trace")
+    parser.add_argument('--out', default='benchmark.json', help="json file for the results")
+    parser.add_argument('--compare', help="results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=1.1, help="slowdown reported as regression")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--record', action='store_true', help="record the trace again first")
+    args = parser.parse_args()
+
+    if args.record:
+        recordTrace()
+    results = run(repeat=args.repeat)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    for agent, result in sorted(results['agents'].items()):
+        print("%s (peak memory +%d kB)" % (agent, result['peakMemoryKb']))
+        for method in METHODS:
+            if method in result['methods']:
+                timing = result['methods'][method]
+                print("    %-16s %8.0f ns %8.3f objects retained" % (method, timing['nsPerCall'],
+                                                                    timing['retainedObjectsPerCall']))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for agent, method, before, after in regressions:
+            print("slower: %s.%s %.0f ns -> %.0f ns" % (agent, method, before, after))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import json
+import os
+import random
+import struct
+import threading
+import time
+
+import numpy as np
+
+from QTable import DenseQTable, HashedQTable
+from ReplayBuffer import ReplayBuffer
+from ScoreStats import ScoreStats
+
+# file layout: MAGIC, the length of the header (4 bytes, little endian), the
+# header as json, then the raw arrays, each starting at a multiple of ALIGNMENT
+MAGIC = b'FLAPPYQ\0'
+VERSION = 1
+ALIGNMENT = 64
+
+HYPERPARAMETERS = ('alpha', 'gamma', 'epsilon', 'actionRepeat', '_episodeCount', '_replayCount')
+
+
+def _toPython(value):
+    """ numpy scalars (e.g. a hyperparameter set by a sweep) for json """
+    return value.item()
+
+
+def _jsonable(value):
+    """ the spec as it reads back from json (tuples become lists) """
+    return json.loads(json.dumps(value, default=_toPython))
+
+
+def snapshot(agent, scores=None, extra=None, generators=None):
+    """ copies everything save writes, so the agent can go on training while
+        the copy is written (see write and PeriodicCheckpointer).
+
+        generators maps names to np.random.RandomState instances whose state
+        is recorded along with the state of the random and np.random modules
+        and the agent's own random numbers (see Exploration).
+    """
+    header = {
+        'version': VERSION,
+        'agent': agent.__class__.__name__,
+        'hyperparameters': dict((name, getattr(agent, name)) for name in HYPERPARAMETERS if hasattr(agent, name)),
+        'extra': extra,
+        'random': random.getstate(),
+        'randomStates': {},
+    }
+    arrays = []
+    if hasattr(agent, '_thetaA0'):
+        arrays.append(('theta', np.array([agent._thetaA0, agent._thetaA1], dtype='<f8')))
+    elif isinstance(agent._q, HashedQTable):
+        header['stateSpec'] = agent.stateSpec
+        header['hashed'], tableArrays = agent._q.snapshot()
+        arrays.extend(tableArrays)
+    else:
+        header['stateSpec'] = getattr(agent, 'stateSpec', None)
+        header['stateBounds'] = agent._q.bounds
+        arrays.append(('q', np.array(agent._q.values, dtype='<f8')))
+        arrays.append(('visited', np.array(agent._q._visitedArray, dtype=np.uint8)))
+    if getattr(agent, '_replay', None) is not None:
+        header['replay'], replayArrays = agent._replay.snapshot()
+        arrays.extend(replayArrays)
+    if hasattr(agent, 'snapshotModel'):
+        header['model'], modelArrays = agent.snapshotModel()
+        arrays.extend(modelArrays)
+    if hasattr(agent, '_random'):
+        state, uniforms, bits = agent._random.getState()
+        header['agentRandom'] = [state[0]] + list(state[2:])
+        arrays.append(('agentRandom_key', np.array(state[1], dtype='<u4')))
+        arrays.append(('agentRandom_uniforms', np.array(uniforms, dtype='<f8')))
+        arrays.append(('agentRandom_bits', np.array(bits, dtype=np.uint8)))
+    if isinstance(scores, ScoreStats):
+        header['scores'], scoreArrays = scores.snapshot()
+        arrays.extend(scoreArrays)
+    elif scores is not None:
+        arrays.append(('scores', np.array(scores, dtype='<f8')))
+
+    generators = dict(generators or {}, numpy=np.random.mtrand._rand)
+    for name, generator in sorted(generators.items()):
+        state = generator.get_state()
+        header['randomStates'][name] = [state[0]] + list(state[2:])
+        arrays.append(('randomState_' + name, np.array(state[1], dtype='<u4')))
+    return header, arrays
+
+
+def write(path, snapshot):
+    """ writes a snapshot to path. The file is written next to path and then
+        renamed, so readers never see a partially written checkpoint.
+    """
+    header, arrays = snapshot
+    header = dict(header)
+
+    # the offsets depend on the length of the header, which contains them
+    offset = 0
+    while True:
+        header['arrays'] = []
+        position = offset
+        for name, values in arrays:
+            header['arrays'].append({'name': name, 'dtype': values.dtype.str, 'shape': values.shape,
+                                     'offset': position})
+            position += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+        encoded = json.dumps(header, sort_keys=True, default=_toPython).encode('utf-8')
+        start = -(-(len(MAGIC) + 4 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+        if start == offset:
+            break
+        offset = start
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        for entry, (name, values) in zip(header['arrays'], arrays):
+            f.write(b'\0' * (entry['offset'] - f.tell()))
+            f.write(values.tobytes())
+    os.rename(path + '.tmp', path)
+
+
+def save(agent, path, scores=None, extra=None, generators=None):
+    """ writes the learned values of agent to path: the q-table (and which
+        states were visited) of the tabular agents or theta of LFA, the
+        experience replay buffer (see ReplayBuffer) if the agent has one, the
+        model of DynaQAgent, plus optionally the training scores.
+
+        The header records the format version, the agent class, its state
+        discretization (stateSpec and stateBounds), its hyperparameters and
+        the state of the random generators (see snapshot), extra is stored in
+        it as given (anything json can encode).
+    """
+    write(path, snapshot(agent, scores, extra, generators))
+
+
+def openCheckpoint(path, mode='r'):
+    """ returns (header, arrays) where arrays maps the array names to
+        np.memmap views of the file, nothing is read until it is used.
+        mode is the np.memmap mode, 'r' maps read-only and can be shared
+        by any number of processes.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a checkpoint" % path)
+        length, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header['version'] > VERSION:
+        raise ValueError("%s has format version %d, only %d is supported" % (path, header['version'], VERSION))
+
+    arrays = {}
+    for entry in header['arrays']:
+        arrays[entry['name']] = np.memmap(path, dtype=np.dtype(str(entry['dtype'])), mode=mode,
+                                          offset=entry['offset'], shape=tuple(entry['shape']))
+    return header, arrays
+
+
+def load(agent, path, copy=True):
+    """ loads a checkpoint written by save into agent (including the state
+        of its random numbers) and returns its header and arrays (see
+        openCheckpoint).
+
+        With copy=True the values are copied into the agent, which can go on
+        training. With copy=False the agent uses the read-only mapped file
+        directly, which takes no time and memory but only allows policy().
+        A HashedQTable is always copied.
+
+        Raises ValueError if the checkpoint was written by an agent with a
+        different discretization.
+    """
+    header, arrays = openCheckpoint(path)
+    for name, value in header['hyperparameters'].items():
+        setattr(agent, str(name), value)
+
+    if 'theta' in arrays:
+        if not hasattr(agent, '_thetaA0'):
+            raise ValueError("%s contains theta of %s, not a q-table" % (path, header['agent']))
+        theta = arrays['theta']
+        if copy:
+            # theta is updated in place by the non-linear LFA
+            agent._thetaA0 = theta[0].tolist()
+            agent._thetaA1 = theta[1].tolist()
+        else:
+            agent._thetaA0 = theta[0]
+            agent._thetaA1 = theta[1]
+    elif 'hashed' in header:
+        if not isinstance(getattr(agent, '_q', None), HashedQTable):
+            raise ValueError("%s contains the hashed q-table of %s" % (path, header['agent']))
+        if _jsonable(agent.stateSpec) != header['stateSpec']:
+            raise ValueError("%s was written by %s with a different discretization" % (path, header['agent']))
+        agent._q.restore(header['hashed'], arrays)
+    else:
+        if hasattr(agent, '_thetaA0'):
+            raise ValueError("%s contains the q-table of %s, not theta" % (path, header['agent']))
+        if isinstance(agent._q, HashedQTable):
+            raise ValueError("%s contains the dense q-table of %s" % (path, header['agent']))
+        if (_jsonable(getattr(agent, 'stateSpec', None)) != header['stateSpec']
+                or _jsonable(agent._q.bounds) != header['stateBounds']):
+            raise ValueError("%s was written by %s with a different discretization" % (path, header['agent']))
+        if copy:
+            agent._q.values[:] = arrays['q']
+            agent._q._visitedArray[:] = arrays['visited']
+        else:
+            # the compiled stateIndex only depends on the bounds, so it stays valid
+            agent._q = DenseQTable(agent._q.bounds, values=arrays['q'], visited=arrays['visited'])
+    if hasattr(agent, '_replay'):
+        # without one in the checkpoint the agent makes its buffer when it
+        # observes the first transition, like after the checkpoint was taken
+        agent._replay = ReplayBuffer.fromSnapshot(header['replay'], arrays) if 'replay' in header else None
+    if hasattr(agent, 'restoreModel'):
+        agent.restoreModel(header.get('model'), arrays)
+
+    if 'agentRandom' in header and hasattr(agent, '_random'):
+        state = header['agentRandom']
+        agent._random.setState(((str(state[0]), np.array(arrays['agentRandom_key'])) + tuple(state[1:]),
+                                arrays['agentRandom_uniforms'].tolist(), arrays['agentRandom_bits'].tolist()))
+    return header, arrays
+
+
+def restoreRandom(header, arrays, generators=None):
+    """ restores the state of the random and np.random modules and of the
+        named np.random.RandomState instances in generators recorded by save
+    """
+    version, internal, gauss = header['random']
+    random.setstate((version, tuple(internal), gauss))
+    generators = dict(generators or {}, numpy=np.random.mtrand._rand)
+    for name, generator in generators.items():
+        if name in header['randomStates']:
+            state = header['randomStates'][name]
+            generator.set_state((str(state[0]), np.array(arrays['randomState_' + name])) + tuple(state[1:]))
+
+
+class PeriodicCheckpointer:
+    """ writes checkpoints of a training session to path from a background
+        thread, every everyEpisodes episodes and/or every everySeconds seconds.
+
+        The training loop calls episodeDone after each episode. When a
+        checkpoint is due it only takes a snapshot (a copy of the table or
+        theta, the scores and the random states) and hands it to the thread,
+        so it never waits for the disk. If the thread is still busy, the
+        newest snapshot replaces the one that is waiting.
+    """
+
+    def __init__(self, path, everyEpisodes=1000, everySeconds=None):
+        self.path = path
+        self.everyEpisodes = everyEpisodes
+        self.everySeconds = everySeconds
+        self.written = 0
+        self._episodes = 0
+        self._lastTime = time.time()
+        self._pending = None
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                pending, self._pending = self._pending, None
+            try:
+                write(self.path, pending)
+                self.written += 1
+            except Exception as e:
+                self._error = e
+
+    def episodeDone(self, agent, scores=None, extra=None, generators=None):
+        """ returns True if a checkpoint was taken """
+        if self._error is not None:
+            raise self._error
+        self._episodes += 1
+        due = self.everyEpisodes and self._episodes % self.everyEpisodes == 0
+        if self.everySeconds is not None and time.time() - self._lastTime >= self.everySeconds:
+            due = True
+        if not due:
+            return False
+        self.checkpoint(agent, scores, extra, generators)
+        return True
+
+    def checkpoint(self, agent, scores=None, extra=None, generators=None):
+        pending = snapshot(agent, scores, extra, generators)
+        self._lastTime = time.time()
+        with self._condition:
+            self._pending = pending
+            self._condition.notify()
+
+    def close(self):
+        """ waits until the last snapshot has been written """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
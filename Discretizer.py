@@ -0,0 +1,174 @@
+import itertools
+import re
+
+import numpy as np
+
+
+class Discretizer:
+    """ Turns a raw game state (the dict returned by getGameState) into a tuple
+        of integers, following a declarative spec.
+
+        spec is a list of (name, expression, edges), one per component of the
+        discretized state. expression is python source evaluated on the raw
+        state s, e.g. "s['player_y'] - s['next_pipe_top_y']".
+        If edges is None the component is int(expression). Otherwise edges are
+        the increasing (integer) bin edges and the component is the index of the
+        bin the value falls in, the same as the ladder
+
+            if value < edges[0]: 0
+            elif value < edges[1]: 1
+            ...
+            else: len(edges)
+
+        Binned components are looked up in a precomputed table indexed by
+        floor(value), values outside of the table are clamped to the first or
+        last bin.
+    """
+
+    def __init__(self, spec):
+        self.spec = tuple((name, expression, None if edges is None else tuple(edges))
+                          for name, expression, edges in spec)
+        self.names = tuple(name for name, expression, edges in self.spec)
+
+        # lookup tables for the binned components, covering the raw values
+        # edges[0] - 1 ... edges[-1]
+        self.tables = {}
+        for name, expression, edges in self.spec:
+            if edges is None:
+                continue
+            if any(int(e) != e for e in edges) or list(edges) != sorted(edges):
+                raise ValueError("edges of '%s' have to be increasing integers" % name)
+            low = int(edges[0]) - 1
+            values = np.arange(low, int(edges[-1]) + 1)
+            self.tables[name] = (low, np.searchsorted(edges, values, side='right').tolist())
+
+        self.discretize = self._compile()
+
+    def _compile(self, strides=None, base=0, offsets=None):
+        """ generates the function state -> discretized tuple, or, if strides
+            are given, state -> base + sum(component * stride). offsets are
+            added to the binned components of the tuple.
+        """
+        namespace = {}
+        lines = ['def discretize(s):']
+        terms = []
+        for k, (name, expression, edges) in enumerate(self.spec):
+            stride = 1 if strides is None else strides[k]
+            offset = 0 if offsets is None else offsets[k]
+            if edges is None:
+                term = 'int(%s)' % expression
+                if strides is not None:
+                    term = '%s * %d' % (term, stride)
+                terms.append(term)
+                continue
+            low, table = self.tables[name]
+            namespace['table%d' % k] = [b * stride + offset for b in table]
+            lines.append('    i%d = int((%s) // 1) - %d' % (k, expression, low))
+            lines.append('    i%d = table%d[i%d] if 0 <= i%d < %d else table%d[0 if i%d < 0 else -1]'
+                         % (k, k, k, k, len(table), k, k))
+            terms.append('i%d' % k)
+        if strides is None:
+            lines.append('    return (%s,)' % ', '.join(terms))
+        else:
+            lines.append('    return %d + %s' % (base, ' + '.join(terms)))
+        exec('\n'.join(lines), namespace)
+        return namespace['discretize']
+
+    def bounds(self, ranges):
+        """ the (low, high) range of every component (both inclusive) for the
+            raw states whose values lie within ranges, a dict mapping the keys
+            of the state to (low, high) pairs (see FlappyBirdSim.STATE_RANGES).
+            The expressions have to be monotonic in every value of the state,
+            the extremes are taken at the corners of the ranges.
+        """
+        keys = sorted(set(key for name, expression, edges in self.spec
+                          for key in re.findall(r"s\['(\w+)'\]", expression)))
+        corners = [self.discretize(dict(zip(keys, values)))
+                   for values in itertools.product(*[ranges[key] for key in keys])]
+        return tuple((min(corner[k] for corner in corners), max(corner[k] for corner in corners))
+                     for k in range(len(self.spec)))
+
+    def checkBounds(self, bounds, ranges):
+        """ raises a ValueError if bounds (one (low, high) pair per component)
+            do not hold every discretized state of the raw ranges (see bounds)
+        """
+        if len(bounds) != len(self.spec):
+            raise ValueError("%d bounds for the %d components %s" % (len(bounds), len(self.spec), self.names))
+        for name, (low, high), (needLow, needHigh) in zip(self.names, bounds, self.bounds(ranges)):
+            if low > needLow or high < needHigh:
+                raise ValueError("'%s' takes the values %d ... %d, its bounds are (%d, %d)"
+                                 % (name, needLow, needHigh, low, high))
+
+    def indexer(self, q):
+        """ returns a function mapping a raw state directly to q.index(discretize(s))
+            for a DenseQTable q, without building the intermediate tuple
+        """
+        base = -sum(low * stride for (low, high), stride in zip(q.bounds, q.strides))
+        return self._compile(q.strides, base)
+
+    def stateIndexer(self, bounds):
+        """ returns a function mapping a raw state to the row-major index of its
+            discretized state in the grid of bounds (one (low, high) pair per
+            component, both inclusive, like DenseQTable)
+        """
+        strides = []
+        size = 1
+        for low, high in reversed(bounds):
+            strides.insert(0, size)
+            size *= high - low + 1
+        base = -sum(low * stride for (low, high), stride in zip(bounds, strides))
+        return self._compile(strides, base)
+
+    def packer(self):
+        """ returns (pack, unpack): pack maps a raw state to its discretized
+            state packed into one non-negative 63 bit integer, 63 // n bits per
+            component (15 bits, -16384 ... 16383, for 4 components), unpack
+            returns the tuple of a packed key. Used as the keys of HashedQTable,
+            the components are not checked against their range.
+        """
+        bits = 63 // len(self.spec)
+        bias = 1 << (bits - 1)
+        mask = (1 << bits) - 1
+        shifts = [bits * k for k in reversed(range(len(self.spec)))]
+        pack = self._compile([1 << shift for shift in shifts], sum(bias << shift for shift in shifts))
+
+        def unpack(key):
+            return tuple(((key >> shift) & mask) - bias for shift in shifts)
+        return pack, unpack
+
+    def oneHot(self):
+        """ for specs where every component is binned: returns (function, size)
+            where the function maps a raw state to the indices of its active
+            features when each component is one-hot encoded over its bins, one
+            block of features after the other, and size is the number of features
+        """
+        offsets = []
+        size = 0
+        for name, expression, edges in self.spec:
+            if edges is None:
+                raise ValueError("'%s' has no bins to one-hot encode" % name)
+            offsets.append(size)
+            size += len(edges) + 1
+        return self._compile(offsets=offsets), size
+
+    def discretizeMany(self, states):
+        """ discretizes many states at once, returns an integer array with one
+            row per state. states is either a list of state dicts or a dict of
+            arrays, one per key of the state.
+        """
+        if not isinstance(states, dict):
+            states = dict((key, np.array([s[key] for s in states])) for key in states[0])
+        namespace = {'s': states, 'int': _truncate}
+        columns = []
+        for name, expression, edges in self.spec:
+            values = eval(expression, namespace)
+            if edges is None:
+                columns.append(_truncate(values))
+            else:
+                columns.append(np.searchsorted(edges, values, side='right'))
+        return np.column_stack(columns)
+
+
+def _truncate(values):
+    """ int() for arrays: rounds towards zero """
+    return np.trunc(values).astype(np.int64)
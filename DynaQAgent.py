@@ -0,0 +1,199 @@
+import heapq
+
+import numpy as np
+
+from AgentCore import TabularAgent
+from QLearningAgent import QLearingAgent
+
+class DynaQAgent(QLearingAgent):
+    """ Dyna-Q with prioritized sweeping: q-learning on the real transitions,
+        plus a learned model of the game over the discretized states that is
+        used to back up more q-values per frame without playing more frames.
+
+        The model keeps for every state-action pair the sum of its rewards,
+        the number of times it was done and how often it led to each next
+        state (None for the end of an episode), so a backup from the model is
+        the expected q-learning target over the observed next states. The
+        discretization aliases states, the model is stochastic even though
+        the game is not.
+
+        After every real step the pairs whose model target differs from their
+        q-value by more than priorityThreshold go into a priority queue keyed
+        by that difference (the pair itself, and the pairs leading to its
+        state since its value changed). Then up to planningSteps backups per
+        frame are done from the queue, largest first, each queueing the
+        predecessors of the backed up state in turn. planningSteps = 0 is
+        exactly q-learning with gamma 0.9 (QLearingAgent with its gamma set
+        to 0.9). plan can also be called directly to spend idle time, e.g.
+        between episodes.
+
+        gamma is below 1 since the model backups repeat until the values are
+        consistent with the model: with gamma = 1 the loops of the model that
+        pass pipes would grow without bound.
+
+        Checkpoints (see Checkpoint) keep the model, the predecessors and the
+        queue along with the q-table (see snapshotModel), so a resumed agent
+        plans exactly like the one that was interrupted. The discretization,
+        the policies and reward_values are QLearingAgent's.
+    """
+    gamma = 0.9
+    # model backups per frame of the game, and the smallest change queued for one
+    planningSteps = 10
+    planningAlpha = 1.0
+    priorityThreshold = 1e-3
+    # observeFeatures is the one below, not picked by tabular
+    update = None
+
+    def __init__(self, seed=42):
+        TabularAgent.__init__(self, seed)
+
+        # the model: flat q-table index of a pair -> [reward sum, count,
+        # [[next state features (None at the end), count], ...]], and the
+        # pairs leading to each state. The next states are a list, not a dict,
+        # so a clone (see AgentState) sums them in the same order.
+        self._model = {}
+        self._predecessors = {}
+        # heap of (-priority, flat index), _queued has the current priority of
+        # every queued pair, entries of the heap that differ from it are stale
+        self._queue = []
+        self._queued = {}
+        return
+
+    def observeFeatures(self, f1, a, r, f2, end):
+        """ observe for the features of s1 and s2 (see featurize), f2 is None if end """
+        q = self._q
+        i1 = f1 + a
+
+        currentQ = q.flat[i1]
+        maxNextQ = 0
+        if not end:
+            qS2A0 = q.flat[f2]
+            qS2A1 = q.flat[f2 + 1]
+            if(qS2A0 > qS2A1):
+                maxNextQ = qS2A0
+            else:
+                maxNextQ = qS2A1
+        newQ = currentQ + self.alpha * (r + self.gamma ** self.actionRepeat * maxNextQ - currentQ)
+
+        q.write(i1, newQ)
+
+        if not self.planningSteps:
+            return
+
+        entry = self._model.get(i1)
+        if entry is None:
+            entry = self._model[i1] = [0.0, 0, []]
+        entry[0] += r
+        entry[1] += 1
+        for successor in entry[2]:
+            if successor[0] == f2:
+                successor[1] += 1
+                break
+        else:
+            entry[2].append([f2, 1])
+        if f2 is not None:
+            self._predecessors.setdefault(f2, set()).add(i1)
+
+        self._queuePair(i1)
+        self._queuePredecessors(f1)
+        self.plan(self.planningSteps * self.actionRepeat)
+        return
+
+    def _modelTarget(self, i):
+        """ the expected q-learning target of pair i under the model """
+        rewardSum, count, successors = self._model[i]
+        flat = self._q.flat
+        expected = 0.0
+        for f2, n in successors:
+            if f2 is not None:
+                qS2A0 = flat[f2]
+                qS2A1 = flat[f2 + 1]
+                expected += n * (qS2A0 if qS2A0 > qS2A1 else qS2A1)
+        return (rewardSum + self.gamma ** self.actionRepeat * expected) / count
+
+    def _queuePair(self, i):
+        priority = abs(self._modelTarget(i) - self._q.flat[i])
+        if priority > self.priorityThreshold and priority > self._queued.get(i, 0.0):
+            self._queued[i] = priority
+            heapq.heappush(self._queue, (-priority, i))
+
+    def _queuePredecessors(self, f):
+        for i in self._predecessors.get(f, ()):
+            self._queuePair(i)
+
+    def snapshotModel(self):
+        """ (header, arrays) with the model, the predecessors and the queue,
+            for Checkpoint and Sweep. The lists of the model are stored as one
+            array of all their entries and one of their lengths, the end of an
+            episode as the next state -1.
+        """
+        pairs = sorted(self._model)
+        entries = [self._model[i] for i in pairs]
+        states = sorted(self._predecessors)
+        predecessors = [sorted(self._predecessors[f]) for f in states]
+        queued = sorted(self._queued)
+        arrays = [
+            ('modelPairs', np.array(pairs, dtype='<i8')),
+            ('modelRewards', np.array([rewardSum for rewardSum, count, successors in entries], dtype='<f8')),
+            ('modelCounts', np.array([count for rewardSum, count, successors in entries], dtype='<i8')),
+            ('modelSuccessorLengths', np.array([len(successors) for rewardSum, count, successors in entries],
+                                               dtype='<i8')),
+            ('modelSuccessors', np.array([-1 if f2 is None else f2 for rewardSum, count, successors in entries
+                                          for f2, n in successors], dtype='<i8')),
+            ('modelSuccessorCounts', np.array([n for rewardSum, count, successors in entries
+                                               for f2, n in successors], dtype='<i8')),
+            ('modelStates', np.array(states, dtype='<i8')),
+            ('modelPredecessorLengths', np.array([len(p) for p in predecessors], dtype='<i8')),
+            ('modelPredecessors', np.array([i for p in predecessors for i in p], dtype='<i8')),
+            ('modelHeapPriorities', np.array([priority for priority, i in self._queue], dtype='<f8')),
+            ('modelHeapPairs', np.array([i for priority, i in self._queue], dtype='<i8')),
+            ('modelQueued', np.array(queued, dtype='<i8')),
+            ('modelQueuedPriorities', np.array([self._queued[i] for i in queued], dtype='<f8')),
+        ]
+        return {'pairs': len(pairs)}, arrays
+
+    def restoreModel(self, header, arrays):
+        """ loads a snapshotModel, an empty model if header is None (e.g. a
+            checkpoint written before the model was kept)
+        """
+        self._model = {}
+        self._predecessors = {}
+        self._queue = []
+        self._queued = {}
+        if header is None:
+            return
+        successors = zip([None if f2 == -1 else f2 for f2 in arrays['modelSuccessors'].tolist()],
+                         arrays['modelSuccessorCounts'].tolist())
+        start = 0
+        for i, rewardSum, count, length in zip(arrays['modelPairs'].tolist(), arrays['modelRewards'].tolist(),
+                                               arrays['modelCounts'].tolist(),
+                                               arrays['modelSuccessorLengths'].tolist()):
+            self._model[i] = [rewardSum, count, [list(s) for s in successors[start:start + length]]]
+            start += length
+        predecessors = arrays['modelPredecessors'].tolist()
+        start = 0
+        for f, length in zip(arrays['modelStates'].tolist(), arrays['modelPredecessorLengths'].tolist()):
+            self._predecessors[f] = set(predecessors[start:start + length])
+            start += length
+        # the heap as it was, so the stale entries pop in the same order
+        self._queue = zip(arrays['modelHeapPriorities'].tolist(), arrays['modelHeapPairs'].tolist())
+        self._queued = dict(zip(arrays['modelQueued'].tolist(), arrays['modelQueuedPriorities'].tolist()))
+
+    def plan(self, steps):
+        """ does up to steps model backups, the pairs with the largest
+            priority first. Returns the number of backups done.
+        """
+        q = self._q
+        queue = self._queue
+        queued = self._queued
+        done = 0
+        while done < steps and queue:
+            priority, i = heapq.heappop(queue)
+            if queued.get(i) != -priority:
+                continue
+            del queued[i]
+            currentQ = q.flat[i]
+            q.write(i, currentQ + self.planningAlpha * (self._modelTarget(i) - currentQ))
+            self._queuePredecessors(i & ~1)
+            done += 1
+        return done
@@ -0,0 +1,165 @@
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from Exploration import RandomStreams
+
+# the official scoring: 1 for each pipe passed, nothing else counts
+OFFICIAL_REWARDS = {"positive": 1.0, "negative": 0.0, "tick": 0.0, "loss": 0.0, "win": 0.0}
+
+# the agent being evaluated, inherited by the worker processes (see evaluate)
+_agent = None
+
+
+def _initWorker(agent):
+    global _agent
+    _agent = agent
+
+
+def _playSeed(job):
+    """ plays nb_episodes games of the game seeded with seed with the policy
+        of _agent, returns (seed, scores, frames)
+    """
+    seed, nb_episodes, maxFrames, actionRepeat = job
+    from ple import PLE
+    from ple.games.flappybird import FlappyBird
+
+    agent = _agent
+    # ties are broken with the agent's random numbers, drawn from the seed of
+    # the game so the result does not depend on which worker plays which seed
+    if hasattr(agent, '_random'):
+        agent._random = RandomStreams(seed)
+    np.random.seed(seed)
+
+    game = FlappyBird()
+    game.allowed_fps = None
+    env = PLE(game, fps=30, display_screen=False, force_fps=True, rng=seed, reward_values=OFFICIAL_REWARDS)
+    env.init()
+    actionSet = env.getActionSet()
+    act = env.act
+    gameOver = env.game_over
+    getGameState = env.game.getGameState
+    policy = agent.policy
+
+    scores = []
+    frames = []
+    for episode in range(nb_episodes):
+        score = 0
+        frame = 0
+        while frame < maxFrames and not gameOver():
+            action = actionSet[policy(getGameState())]
+            for repeat in range(actionRepeat):
+                score += act(action)
+                frame += 1
+                if frame == maxFrames or gameOver():
+                    break
+        scores.append(score)
+        frames.append(frame)
+        env.reset_game()
+    return seed, scores, frames
+
+
+def evaluate(agent, seeds=range(100), episodesPerSeed=1, maxFrames=10000, actionRepeat=None, processes=None):
+    """ plays episodesPerSeed games for every seed (of the pipe gaps) with
+        agent.policy in headless PLE at full speed, under the official
+        scoring. The seeds are played in parallel worker processes
+        (processes defaults to the number of cores, 1 plays them in this
+        process). Games still running after maxFrames frames are stopped
+        with the score they have. actionRepeat is as in Run.run_game.
+
+        The workers are forked with the agent, which is not pickled, so any
+        agent (or FrozenPolicy) in memory can be evaluated. The agent itself
+        is not changed, with processes=1 a clone (see AgentState) plays.
+
+        Returns a dict with the keys 'seeds', 'scores' and 'frames' (one
+        per game, in the order of the seeds), 'maxFrames' and 'seconds'.
+        See summarize for the statistics. Sweep.evaluate plays in the
+        numpy simulator instead.
+    """
+    if actionRepeat is None:
+        actionRepeat = getattr(agent, 'actionRepeat', 1)
+    jobs = [(seed, episodesPerSeed, maxFrames, actionRepeat) for seed in seeds]
+    start = time.time()
+    if processes == 1:
+        _initWorker(agent.clone() if hasattr(agent, 'clone') else agent)
+        try:
+            results = map(_playSeed, jobs)
+        finally:
+            _initWorker(None)
+    else:
+        pool = multiprocessing.Pool(processes, _initWorker, (agent,))
+        try:
+            results = pool.map(_playSeed, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return {'seeds': np.repeat([seed for seed, scores, frames in results], episodesPerSeed),
+            'scores': np.array([score for seed, scores, frames in results for score in scores], dtype=float),
+            'frames': np.array([frame for seed, scores, frames in results for frame in frames], dtype=np.int64),
+            'maxFrames': maxFrames, 'seconds': time.time() - start}
+
+
+def summarize(results, percentiles=(5, 25, 75, 95), confidence=0.95):
+    """ the statistics of the scores of evaluate as a dict: mean, its
+        confidence interval (student-t, as ParallelRuns.learningCurves),
+        standard deviation, median, min, max and the given percentiles,
+        the mean number of frames per game and the number of games that hit
+        maxFrames (their scores are lower bounds)
+    """
+    from scipy import stats
+
+    scores = results['scores']
+    n = len(scores)
+    mean = scores.mean()
+    std = scores.std(ddof=1) if n > 1 else 0.0
+    halfWidth = stats.t.ppf(0.5 + confidence / 2, n - 1) * std / np.sqrt(n) if n > 1 else 0.0
+    summary = {'episodes': n, 'mean': mean, 'mean_lower': mean - halfWidth, 'mean_upper': mean + halfWidth,
+               'std': std, 'median': np.median(scores), 'min': scores.min(), 'max': scores.max(),
+               'frames': results['frames'].mean(),
+               'capped': int(np.count_nonzero(results['frames'] >= results['maxFrames'])),
+               'seconds': results['seconds'], 'confidence': confidence}
+    for q in percentiles:
+        summary['p%g' % q] = np.percentile(scores, q)
+    return summary
+
+
+def report(summary):
+    print("%d episodes in %.1fs, %d stopped at the frame cap" % (summary['episodes'], summary['seconds'],
+                                                                 summary['capped']))
+    print("mean: %.2f (%g%% confidence interval %.2f - %.2f), std %.2f"
+          % (summary['mean'], summary['confidence'] * 100, summary['mean_lower'], summary['mean_upper'],
+             summary['std']))
+    print("median: %g, min %g, max %g" % (summary['median'], summary['min'], summary['max']))
+    percentiles = sorted((float(name[1:]), name) for name in summary if name.startswith('p'))
+    print("percentiles: %s" % ', '.join('%s %g' % (name, summary[name]) for q, name in percentiles))
+
+
+def loadAgent(path):
+    """ the agent of a checkpoint (see Checkpoint) or a frozen policy (see FrozenPolicy) """
+    import Checkpoint
+    import FrozenPolicy
+
+    header, arrays = Checkpoint.openCheckpoint(path)
+    if header['agent'] == 'FrozenPolicy':
+        return FrozenPolicy.load(path)
+    import Run
+    agent = Run.agentClasses[header['agent']]()
+    Checkpoint.load(agent, path, copy=False)
+    return agent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="evaluates a checkpoint or frozen policy with the official scoring")
+    parser.add_argument('path', help="checkpoint (see Checkpoint) or frozen policy (see FrozenPolicy)")
+    parser.add_argument('--episodes', type=int, default=100, help="number of seeds, one game each")
+    parser.add_argument('--first-seed', type=int, default=0, help="seed of the first game")
+    parser.add_argument('--max-frames', type=int, default=10000, help="frames after which a game is stopped")
+    parser.add_argument('--processes', type=int, help="worker processes, by default one per core")
+    parser.add_argument('--confidence', type=float, default=0.95, help="level of the confidence interval")
+    args = parser.parse_args()
+
+    results = evaluate(loadAgent(args.path), range(args.first_seed, args.first_seed + args.episodes),
+                       maxFrames=args.max_frames, processes=args.processes)
+    report(summarize(results, confidence=args.confidence))
@@ -0,0 +1,60 @@
+import itertools
+
+import numpy as np
+
+
+class RandomStreams:
+    """ The random numbers of one agent: uniform() returns floats in [0, 1)
+        for epsilon-greedy, bit() returns 0 or 1 for random actions and for
+        breaking ties.
+
+        Both are drawn from the agent's own np.random.RandomState in blocks of
+        blockSize numbers. uniform and bit are the next methods of C iterators
+        over the current block, the python code that draws the next block only
+        runs once per block.
+
+        Every agent creates its streams from its own seed, so agents do not
+        share random numbers (or the global random module) and runs with the
+        same seeds are reproducible.
+    """
+
+    def __init__(self, seed=42, blockSize=4096):
+        self.seed = seed
+        self.blockSize = blockSize
+        self.rng = np.random.RandomState(seed)
+        self._start([], [])
+
+    def _start(self, uniforms, bits):
+        """ continues the streams with the given numbers, then with new blocks """
+        self._uniforms = iter(uniforms)
+        self._bits = iter(bits)
+        self.uniform = itertools.chain.from_iterable(self._blocks('_uniforms')).next
+        self.bit = itertools.chain.from_iterable(self._blocks('_bits')).next
+
+    def _blocks(self, name):
+        yield getattr(self, name)
+        while True:
+            if name == '_uniforms':
+                block = self.rng.random_sample(self.blockSize)
+            else:
+                block = self.rng.randint(2, size=self.blockSize)
+            setattr(self, name, iter(block.tolist()))
+            yield getattr(self, name)
+
+    def getState(self):
+        """ (state of rng, the unused uniforms, the unused bits) """
+        uniforms = list(self._uniforms)
+        bits = list(self._bits)
+        self._start(uniforms, bits)
+        return self.rng.get_state(), uniforms, bits
+
+    def setState(self, state):
+        rngState, uniforms, bits = state
+        self.rng.set_state(rngState)
+        self._start(list(uniforms), list(bits))
+
+    def __deepcopy__(self, memo):
+        # the iterators cannot be copied, the copy continues from the state
+        streams = RandomStreams(self.seed, self.blockSize)
+        streams.setState(self.getState())
+        return streams
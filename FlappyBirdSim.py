@@ -0,0 +1,251 @@
+import os
+import sys
+
+import numpy as np
+
+# the constants of PLE's FlappyBird (288x512 screen, 30 fps, force_fps=True)
+WIDTH = 288
+HEIGHT = 512
+PIPE_GAP = 100
+PIPE_WIDTH = 52
+PIPE_MIN = PIPE_GAP // 4
+PIPE_MAX = int(HEIGHT * 0.79 * 0.6 - PIPE_GAP / 2)
+PIPE_SPEED = 4.0
+PLAYER_X = int(WIDTH * 0.2)
+PLAYER_START_Y = int(HEIGHT / 2)
+PLAYER_HEIGHT = 24
+FLAP_POWER = 9.0
+GRAVITY = 1.0
+MAX_DROP_SPEED = 10.0
+GROUND_Y = 0.79 * HEIGHT - PLAYER_HEIGHT
+
+STATE_KEYS = ('player_y', 'player_vel', 'next_pipe_dist_to_player', 'next_pipe_top_y',
+              'next_pipe_bottom_y', 'next_next_pipe_dist_to_player', 'next_next_pipe_top_y',
+              'next_next_pipe_bottom_y')
+
+# the range (low, high) of every value of getGameState() while a game is
+# running, the states the agents discretize. PLE does not reset the velocity
+# between games, a game that starts after a crash into the ceiling gets the
+# thrust of its first flap on top of the upward velocity of the crash.
+# player_y can overshoot the ceiling and the ground by one frame.
+MIN_VEL = -2 * FLAP_POWER + GRAVITY
+STATE_RANGES = {
+    'player_y': (MIN_VEL, GROUND_Y + MAX_DROP_SPEED),
+    'player_vel': (MIN_VEL, MAX_DROP_SPEED),
+    'next_pipe_dist_to_player': (0.0, WIDTH + 1.5 * PIPE_WIDTH - PLAYER_X),
+    'next_pipe_top_y': (PIPE_MIN, PIPE_MAX),
+    'next_pipe_bottom_y': (PIPE_MIN + PIPE_GAP, PIPE_MAX + PIPE_GAP),
+    'next_next_pipe_dist_to_player': (0.0, 1.5 * WIDTH + 1.5 * PIPE_WIDTH - PLAYER_X),
+    'next_next_pipe_top_y': (PIPE_MIN, PIPE_MAX),
+    'next_next_pipe_bottom_y': (PIPE_MIN + PIPE_GAP, PIPE_MAX + PIPE_GAP),
+}
+
+# frames of PLE's FlappyBird the simulator is checked against (see
+# recordTrace and checkFidelity), with the rewards they were recorded with
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FlappyBirdTrace.npz')
+TRACE_REWARDS = {"positive": 1.0, "tick": 0.1, "loss": -5.0}
+
+
+class VectorFlappyBird:
+    """ Headless FlappyBird without pygame, playing nb_envs games in lockstep.
+
+        Follows the rules of PLE's FlappyBird frame by frame: the same
+        getGameState() keys, the same reward_values() semantics ("tick" every
+        frame, "positive" for each pipe passed, "loss" when crashing) and the
+        same actions as the agents use (0 flap the wing, 1 do nothing).
+        Games that are over are frozen (step yields a reward of 0 for them)
+        until they are reset, like PLE.act does.
+    """
+
+    def __init__(self, nb_envs, reward_values=None, rng=None):
+        self.nb_envs = nb_envs
+        self.rewards = {"positive": 1.0, "tick": 0.0, "loss": -5.0}
+        if reward_values is not None:
+            self.rewards.update(reward_values)
+        if isinstance(rng, np.random.RandomState):
+            self.rng = rng
+        else:
+            self.rng = np.random.RandomState(rng)
+
+        self.player_y = np.zeros(nb_envs)
+        # PLE does not reset the velocity between games, only when the game is created
+        self.player_vel = np.zeros(nb_envs)
+        self.flapped = np.zeros(nb_envs, dtype=bool)
+        self.thrust = np.zeros(nb_envs, dtype=bool)
+        self.pipe_x = np.zeros((nb_envs, 3))
+        self.pipe_top_y = np.zeros((nb_envs, 3), dtype=np.int64)
+        self.over = np.zeros(nb_envs, dtype=bool)
+        self.score = np.zeros(nb_envs)
+        self.reset()
+
+    def reset(self, mask=None):
+        """ starts a new game in all environments, or where mask is True """
+        if mask is None:
+            mask = np.ones(self.nb_envs, dtype=bool)
+        count = int(np.count_nonzero(mask))
+        self.player_y[mask] = PLAYER_START_Y
+        # every game starts with a flap
+        self.flapped[mask] = True
+        self.thrust[mask] = False
+        self.pipe_x[mask] = WIDTH + PIPE_WIDTH + np.array([0, WIDTH * 0.5, WIDTH])
+        self.pipe_top_y[mask] = self.rng.randint(PIPE_MIN, PIPE_MAX + 1, size=(count, 3))
+        self.over[mask] = False
+        self.score[mask] = 0.0
+
+    def game_over(self):
+        return self.over.copy()
+
+    def step(self, actions):
+        """ advances every running game by one frame, returns the rewards (an
+            array with one entry per environment) and the game over flags
+        """
+        alive = ~self.over
+        y = self.player_y
+        x = self.pipe_x
+
+        flap = alive & (np.asarray(actions) == 0) & (y > -2.0 * PLAYER_HEIGHT)
+        self.player_vel[flap] = 0.0
+        self.flapped |= flap
+
+        # crashing into a pipe: the sprites overlap (14 < int(x) < 100) and the
+        # player is in front of the pipe's end (31 < x <= 103)
+        inPipe = (x > 31) & (x < 100)
+        outsideGap = (y[:, None] <= self.pipe_top_y) | (y[:, None] + PLAYER_HEIGHT > self.pipe_top_y + PIPE_GAP)
+        crashed = (inPipe & outsideGap).any(axis=1) | (y >= GROUND_Y) | (y <= 0)
+        passed = ((x - PIPE_WIDTH / 2 <= PLAYER_X) & (PLAYER_X < x - PIPE_WIDTH / 2 + 4)).sum(axis=1)
+
+        recycle = (x < -PIPE_WIDTH) & alive[:, None]
+        count = int(np.count_nonzero(recycle))
+        if count:
+            x[recycle] = WIDTH + PIPE_WIDTH + WIDTH * 0.2
+            self.pipe_top_y[recycle] = self.rng.randint(PIPE_MIN, PIPE_MAX + 1, size=count)
+
+        # the player: the thrust of a flap is applied during the first frame
+        # after it, gravity is paused during the second one
+        vel = self.player_vel
+        vel[alive & (vel < MAX_DROP_SPEED) & ~self.thrust] += GRAVITY
+        thrusting = alive & self.flapped & ~self.thrust
+        vel[thrusting] -= FLAP_POWER
+        self.flapped &= ~alive | thrusting
+        self.thrust = np.where(alive, thrusting, self.thrust)
+        y[alive] += vel[alive]
+        x[alive] -= PIPE_SPEED
+
+        reward = self.rewards["tick"] + self.rewards["positive"] * passed + self.rewards["loss"] * crashed
+        reward[~alive] = 0.0
+        self.score += reward
+        self.over |= alive & crashed
+        return reward, self.over.copy()
+
+    def getGameState(self):
+        """ returns the game states as a dict of arrays (one entry per environment) """
+        # the two nearest pipes in front of the player
+        dist = self.pipe_x + PIPE_WIDTH / 2 - PLAYER_X
+        ahead = np.where(dist > 0, dist, np.inf)
+        order = np.argsort(ahead, axis=1, kind='mergesort')
+        rows = np.arange(self.nb_envs)
+        nextPipe = order[:, 0]
+        nextNextPipe = order[:, 1]
+        return {
+            'player_y': self.player_y.copy(),
+            'player_vel': self.player_vel.copy(),
+            'next_pipe_dist_to_player': dist[rows, nextPipe],
+            'next_pipe_top_y': self.pipe_top_y[rows, nextPipe],
+            'next_pipe_bottom_y': self.pipe_top_y[rows, nextPipe] + PIPE_GAP,
+            'next_next_pipe_dist_to_player': dist[rows, nextNextPipe],
+            'next_next_pipe_top_y': self.pipe_top_y[rows, nextNextPipe],
+            'next_next_pipe_bottom_y': self.pipe_top_y[rows, nextNextPipe] + PIPE_GAP,
+        }
+
+    def getGameStates(self):
+        """ returns the game states as a list of dicts, one per environment,
+            in the format of PLE's getGameState()
+        """
+        states = self.getGameState()
+        columns = [states[key].tolist() for key in STATE_KEYS]
+        return [dict(zip(STATE_KEYS, values)) for values in zip(*columns)]
+
+
+def recordTrace(path=TRACE, nb_frames=2000, seed=0):
+    """ plays nb_frames random frames (10% flaps) in PLE's FlappyBird and
+        records what checkFidelity compares the simulator with. Needs PLE.
+
+        The pipe gaps are random, the trace keeps the pipes of PLE when a game
+        starts (startPipeX, startPipeTopY, one row per game) and the gaps of
+        its pipes, ordered by x, after every frame (pipeTopY).
+    """
+    from ple import PLE
+    from ple.games.flappybird import FlappyBird
+
+    game = FlappyBird()
+    game.allowed_fps = None
+    env = PLE(game, fps=30, display_screen=False, force_fps=True, rng=seed, reward_values=TRACE_REWARDS)
+    env.init()
+    rng = np.random.RandomState(seed)
+
+    def pipes():
+        return sorted(game.pipe_group, key=lambda p: p.x)
+
+    columns = dict((key, []) for key in STATE_KEYS)
+    actions, rewards, ends, pipeTopY = [], [], [], []
+    startPipeX, startPipeTopY = [[p.x for p in pipes()]], [[p.gap_start for p in pipes()]]
+    for frame in range(nb_frames):
+        action = 0 if rng.rand() < 0.1 else 1
+        rewards.append(env.act(env.getActionSet()[action]))
+        actions.append(action)
+        ends.append(env.game_over())
+        pipeTopY.append([p.gap_start for p in pipes()])
+        state = game.getGameState()
+        for key in STATE_KEYS:
+            columns[key].append(state[key])
+        if env.game_over():
+            env.reset_game()
+            startPipeX.append([p.x for p in pipes()])
+            startPipeTopY.append([p.gap_start for p in pipes()])
+    np.savez_compressed(path, actions=np.array(actions), rewards=np.array(rewards), ends=np.array(ends),
+                        pipeTopY=np.array(pipeTopY), startPipeX=np.array(startPipeX),
+                        startPipeTopY=np.array(startPipeTopY), **columns)
+
+
+def checkFidelity(path=TRACE):
+    """ replays the frames recorded in PLE by recordTrace in the simulator and
+        returns the number of frames where the game states, rewards or game
+        over flags differ. Runs without PLE.
+
+        The simulator takes over PLE's pipe gaps whenever a game starts or a
+        pipe gets regenerated.
+    """
+    if not os.path.exists(path):
+        raise IOError("no trace in %s, record one with recordTrace where PLE is installed" % path)
+    data = np.load(path)
+    sim = VectorFlappyBird(1, reward_values=TRACE_REWARDS, rng=0)
+    starts = iter(zip(data['startPipeX'], data['startPipeTopY']))
+
+    def startGame():
+        sim.pipe_x[0], sim.pipe_top_y[0] = next(starts)
+
+    startGame()
+    states = np.column_stack([data[key] for key in STATE_KEYS])
+    rewards = data['rewards']
+    ends = data['ends']
+    mismatches = 0
+    for frame, action in enumerate(data['actions'].tolist()):
+        simReward, simOver = sim.step([action])
+
+        sim.pipe_top_y[0, np.argsort(sim.pipe_x[0])] = data['pipeTopY'][frame]
+        simState = sim.getGameStates()[0]
+        if (any(abs(state - simState[key]) > 1e-9 for key, state in zip(STATE_KEYS, states[frame]))
+                or abs(rewards[frame] - simReward[0]) > 1e-9 or ends[frame] != simOver[0]):
+            mismatches += 1
+
+        if ends[frame]:
+            sim.reset()
+            startGame()
+    return mismatches
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['record']:
+        recordTrace()
+    else:
+        print("frames differing from PLE: %d" % checkFidelity())
@@ -0,0 +1,130 @@
+import numpy as np
+
+import Checkpoint
+from Discretizer import Discretizer
+from QTable import HashedQTable
+
+# the actions of Flappy Bird
+FLAP = 0
+NOOP = 1
+
+
+class FrozenPolicy:
+    """ The greedy policy of a trained agent (see freeze): the action of every
+        discretized state, so policy(state) is the compiled state index of the
+        agent's Discretizer and a single lookup, without dicts, random numbers
+        or side effects.
+
+        On disk (see save) the actions are packed into one bit per state, in
+        memory they are unpacked into a bytearray with one byte per state.
+
+        The raw LFA has no discretization, its frozen policy keeps the two
+        weight vectors and compares the two dot products instead.
+
+        Only needs numpy, not pandas or seaborn like the agents.
+    """
+
+    def __init__(self, stateSpec, bounds, actions=None, weights=None, actionRepeat=1):
+        self.stateSpec = stateSpec
+        self.bounds = bounds
+        self.actionRepeat = actionRepeat
+        self.weights = weights
+        if weights is not None:
+            theta0, theta1 = [[float(w) for w in theta] for theta in weights]
+            self.policy = _linearPolicy(theta0, theta1)
+        else:
+            self.actions = bytearray(np.asarray(actions, dtype=np.uint8).tobytes())
+            index = Discretizer(stateSpec).stateIndexer(bounds)
+            actions = self.actions
+            self.policy = lambda s: actions[index(s)]
+
+    def training_policy(self, state):
+        return self.policy(state)
+
+    def save(self, path):
+        """ writes the policy in the checkpoint file format (see Checkpoint) """
+        header = {'version': Checkpoint.VERSION, 'agent': 'FrozenPolicy', 'stateSpec': self.stateSpec,
+                  'stateBounds': self.bounds, 'actionRepeat': self.actionRepeat}
+        if self.weights is not None:
+            arrays = [('weights', np.array(self.weights, dtype='<f8'))]
+        else:
+            actions = np.frombuffer(self.actions, dtype=np.uint8)
+            arrays = [('bits', np.packbits(actions)), ('nbStates', np.array([len(actions)], dtype='<i8'))]
+        Checkpoint.write(path, (header, arrays))
+
+
+def _linearPolicy(theta0, theta1):
+    """ the greedy policy of the raw LFA: the action with the larger dot product """
+    w0, w1, w2, w3 = theta0
+    v0, v1, v2, v3 = theta1
+
+    def policy(s):
+        x0 = s['next_pipe_top_y']
+        x1 = s['player_y']
+        x2 = s['player_vel']
+        x3 = s['next_pipe_dist_to_player']
+        return FLAP if w0 * x0 + w1 * x1 + w2 * x2 + w3 * x3 > v0 * x0 + v1 * x1 + v2 * x2 + v3 * x3 else NOOP
+    return policy
+
+
+def greedyActions(q0, q1, tieAction=NOOP):
+    """ FLAP where q0 > q1, NOOP where q1 > q0 and tieAction where they are equal """
+    actions = np.where(q0 > q1, FLAP, NOOP).astype(np.uint8)
+    actions[q0 == q1] = tieAction
+    return actions
+
+
+def freeze(agent, tieAction=NOOP, unseenAction=NOOP):
+    """ compiles the greedy policy of agent into a FrozenPolicy.
+
+        Tabular agents: the action of every state of the q-table, tieAction
+        where both q-values are equal and unseenAction for the states that were
+        never written. The non-linear LFA: the action of every combination of
+        bins of its stateSpec. The agents pick randomly on ties, the frozen
+        policy always picks tieAction.
+    """
+    actionRepeat = getattr(agent, 'actionRepeat', 1)
+    if isinstance(getattr(agent, '_q', None), HashedQTable):
+        raise ValueError("the states of a HashedQTable have no dense index to freeze")
+    if hasattr(agent, '_q'):
+        values = np.asarray(agent._q.values).reshape(-1, 2)
+        actions = greedyActions(values[:, 0], values[:, 1], tieAction)
+        actions[np.asarray(agent._q._visitedArray) == 0] = unseenAction
+        return FrozenPolicy(agent.stateSpec, agent._q.bounds, actions=actions, actionRepeat=actionRepeat)
+
+    if not hasattr(agent, 'stateSpec'):
+        return FrozenPolicy(None, None, weights=[list(agent._thetaA0), list(agent._thetaA1)],
+                            actionRepeat=actionRepeat)
+
+    # the q-value of a combination of bins is the sum of the weights of one
+    # feature per component, added up in the order of calcQA0/calcQA1
+    sizes = [len(edges) + 1 for name, expression, edges in agent.stateSpec]
+    q = []
+    for theta in (agent._thetaA0, agent._thetaA1):
+        theta = np.asarray(theta, dtype=float)
+        total = np.zeros(sizes)
+        offset = 0
+        for k, size in enumerate(sizes):
+            shape = [1] * len(sizes)
+            shape[k] = size
+            total = total + theta[offset:offset + size].reshape(shape)
+            offset += size
+        q.append(total.ravel())
+    bounds = tuple((0, size - 1) for size in sizes)
+    return FrozenPolicy(agent.stateSpec, bounds, actions=greedyActions(q[0], q[1], tieAction),
+                        actionRepeat=actionRepeat)
+
+
+def load(path):
+    """ reads a FrozenPolicy written by save """
+    header, arrays = Checkpoint.openCheckpoint(path)
+    if header['agent'] != 'FrozenPolicy':
+        raise ValueError("%s is a checkpoint of %s, not a frozen policy" % (path, header['agent']))
+    bounds = header['stateBounds']
+    if bounds is not None:
+        bounds = tuple((low, high) for low, high in bounds)
+    if 'weights' in arrays:
+        return FrozenPolicy(None, None, weights=np.array(arrays['weights']).tolist(),
+                            actionRepeat=header['actionRepeat'])
+    actions = np.unpackbits(arrays['bits'])[:int(arrays['nbStates'][0])]
+    return FrozenPolicy(header['stateSpec'], bounds, actions=actions, actionRepeat=header['actionRepeat'])
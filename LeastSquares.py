@@ -0,0 +1,208 @@
+import numpy as np
+
+import TransitionLog
+
+# transitions per block when A and b are rebuilt, bounds the temporary matrices
+BLOCK_ROWS = 16384
+
+
+class LSPI:
+    """ Least-squares policy iteration for the linear approximators (LFA in
+        LinearFunctionApproximation and LinearFunctionApproximationNonLinear).
+
+        q(s, a) = theta[a] . x(s) where x(s) are the k features of the state
+        (the raw state, or the one-hot bins with oneHot = True). phi(s, a) is
+        x(s) in the block of a of a vector of 2k, so the weights of both
+        actions are one vector. LSTDQ evaluates a policy pi by solving
+        A theta = b with
+
+            A = sum phi(s1, a) (phi(s1, a) - discount * phi(s2, pi(s2)))' + regularization * I
+            b = sum phi(s1, a) r
+
+        over the collected transitions, discount is 0 at the end of an episode.
+
+        add collects one transition and updates the inverse of A with the
+        Sherman-Morrison formula, so the weights of the policy being evaluated
+        (the greedy policy of theta) never need a solve. solve then iterates
+        the policy: A and b are rebuilt from all transitions for the greedy
+        policy of the new weights and solved with numpy until the weights stop
+        changing, usually within a handful of iterations. There is no step
+        size, the weights cannot diverge like the gradient steps of LFA.
+    """
+
+    def __init__(self, nbFeatures, oneHot=False, regularization=1e-3, capacity=4096):
+        self.nbFeatures = nbFeatures
+        self.oneHot = oneHot
+        self.regularization = regularization
+        self.theta = np.zeros((2, nbFeatures))
+
+        self.size = 0
+        self.x1 = np.zeros((capacity, nbFeatures))
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity)
+        self.x2 = np.zeros((capacity, nbFeatures))
+        self.discounts = np.zeros(capacity)
+
+        dimension = 2 * nbFeatures
+        self._inverse = np.eye(dimension) / regularization
+        self._b = np.zeros(dimension)
+
+    def __len__(self):
+        return self.size
+
+    def vectors(self, features):
+        """ the feature vectors x(s) of a list of the agent's features """
+        if not self.oneHot:
+            return np.array(features, dtype=np.float64).reshape(-1, self.nbFeatures)
+        x = np.zeros((len(features), self.nbFeatures))
+        if len(features):
+            indices = np.array(features, dtype=np.int64)
+            x[np.arange(len(features))[:, None], indices] = 1.0
+        return x
+
+    def _reserve(self, n):
+        """ grows the arrays of the transitions by doubling to hold n more """
+        capacity = len(self.rewards)
+        while capacity < self.size + n:
+            capacity *= 2
+        if capacity == len(self.rewards):
+            return
+        for name in ('x1', 'actions', 'rewards', 'x2', 'discounts'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _store(self, x1, actions, rewards, x2, discounts):
+        n = len(rewards)
+        self._reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.x1[rows] = x1
+        self.actions[rows] = actions
+        self.rewards[rows] = rewards
+        self.x2[rows] = x2
+        self.discounts[rows] = discounts
+        self.size += n
+
+    def add(self, f1, a, r, f2, discount):
+        """ collects the transition from the features f1 with action a and
+            reward r to f2 (None at the end of an episode, with discount 0)
+        """
+        x1, = self.vectors([f1])
+        x2 = np.zeros(self.nbFeatures) if f2 is None else self.vectors([f2])[0]
+        self._store(x1[None], [a], [r], x2[None], [discount])
+
+        # Sherman-Morrison: (A + u v')^-1 = B - B u v' B / (1 + v' B u) with
+        # u = phi(s1, a) and v = phi(s1, a) - discount * phi(s2, pi(s2)),
+        # only the rows and columns of B where they are not 0 are read
+        k = self.nbFeatures
+        features1, values1 = self._nonZero(f1, x1)
+        indices1 = features1 + a * k
+        inverse = self._inverse
+        inverseU = inverse[:, indices1].dot(values1)
+        vInverse = values1.dot(inverse[indices1])
+        if discount:
+            a2 = 0 if self.theta[0].dot(x2) > self.theta[1].dot(x2) else 1
+            features2, values2 = self._nonZero(f2, x2)
+            vInverse -= discount * values2.dot(inverse[features2 + a2 * k])
+        inverse -= np.outer(inverseU / (1.0 + vInverse[indices1].dot(values1)), vInverse)
+        self._b[indices1] += r * values1
+
+    def _nonZero(self, f, x):
+        """ (indices, values) of the features of a state that are not 0 """
+        if self.oneHot:
+            return np.array(f, dtype=np.int64), np.ones(len(f))
+        return np.arange(self.nbFeatures), x
+
+    def addMany(self, x1, actions, rewards, x2, discounts):
+        """ collects many transitions at once, as arrays (see vectors). The
+            inverse of A is recomputed on the next solve instead of updated.
+        """
+        self._store(x1, actions, rewards, x2, discounts)
+        self._inverse = None
+
+    def _system(self, theta):
+        """ A and b of LSTDQ for the greedy policy of theta over all transitions """
+        k = self.nbFeatures
+        A = self.regularization * np.eye(2 * k)
+        b = np.zeros(2 * k)
+        for start in range(0, self.size, BLOCK_ROWS):
+            rows = slice(start, min(start + BLOCK_ROWS, self.size))
+            x1 = self.x1[rows]
+            x2 = self.x2[rows]
+            actions = self.actions[rows]
+            nextActions = np.where(x2.dot(theta[0]) > x2.dot(theta[1]), 0, 1)
+
+            phi1 = np.zeros((len(x1), 2 * k))
+            phi2 = np.zeros((len(x1), 2 * k))
+            for action in (0, 1):
+                phi1[actions == action, action * k:(action + 1) * k] = x1[actions == action]
+                phi2[nextActions == action, action * k:(action + 1) * k] = x2[nextActions == action]
+            A += phi1.T.dot(phi1 - self.discounts[rows, None] * phi2)
+            b += phi1.T.dot(self.rewards[rows])
+        return A, b
+
+    def solve(self, iterations=10, tolerance=1e-6):
+        """ policy iteration from the greedy policy of theta: at most
+            iterations evaluations, stops once no weight changes by more than
+            tolerance (relative to the largest weight) or it comes back to
+            earlier weights. Sets and returns theta,
+            shape (2, nbFeatures), and restarts the incremental evaluation (see
+            add) for its greedy policy.
+        """
+        k = self.nbFeatures
+        theta = self.theta
+        seen = [theta]
+        for iteration in range(iterations):
+            if iteration == 0 and self._inverse is not None:
+                solution = self._inverse.dot(self._b)
+            else:
+                A, b = self._system(theta)
+                solution = np.linalg.solve(A, b)
+            theta = solution.reshape(2, k)
+            # policy iteration with approximated values can also cycle
+            # between policies instead of converging (seen with gamma = 1)
+            limit = tolerance * max(1.0, np.abs(theta).max())
+            if any(np.abs(theta - old).max() <= limit for old in seen):
+                break
+            seen.append(theta)
+        self.theta = theta
+        A, self._b = self._system(theta)
+        self._inverse = np.linalg.inv(A)
+        return theta
+
+
+def solverFor(agent, regularization=1e-3):
+    """ an LSPI for the features of agent (one-hot for the non-linear LFA),
+        starting from its weights
+    """
+    oneHot = hasattr(agent, 'nbFeatures')
+    lspi = LSPI(agent.nbFeatures if oneHot else len(agent._thetaA0), oneHot, regularization)
+    lspi.theta = np.array([agent._thetaA0, agent._thetaA1], dtype=np.float64)
+    return lspi
+
+
+def train(path, agent, iterations=10, lspi=None):
+    """ solves the weights of agent (an LFA) from the transition log in path
+        (see TransitionLog) with least-squares policy iteration, instead of
+        streaming the transitions through gradient steps like
+        TransitionLog.train. Returns the LSPI, which can be given again with
+        more logs.
+    """
+    if lspi is None:
+        lspi = solverFor(agent)
+    wanted = agent.reward_values()
+    for header, states, actions, rewards, ends, last in TransitionLog.readChunks(path):
+        rewards = TransitionLog.rewardsFor(rewards, header['rewardValues'], wanted, header['actionRepeat'])
+        x = lspi.vectors(TransitionLog.featurizeMany(agent, states))
+        x2 = np.zeros_like(x)
+        x2[:-1] = x[1:]
+        if last is not None:
+            x2[-1] = lspi.vectors([agent.featurize(last)])[0]
+        x2[ends] = 0.0
+        discounts = np.where(ends, 0.0, agent.gamma ** header['actionRepeat'])
+        lspi.addMany(x, actions, rewards, x2, discounts)
+    theta = lspi.solve(iterations)
+    agent._thetaA0 = theta[0].tolist()
+    agent._thetaA1 = theta[1].tolist()
+    return lspi
@@ -1,21 +1,38 @@
-import random
 import numpy as np
 
-class LFA:
+from AgentState import AgentState
+from Exploration import RandomStreams
+from LeastSquares import solverFor
+
+class LFA(AgentState):
     alpha = 0.1
     gamma = 1
     epsilon = 0.1
-
-    _thetaA0 = [0, 0, 0, 0]
-    _thetaA1 = [0, 0, 0, 0]
-
-    def __init__(self):
-        random.seed(42)
+    # frames each decision lasts (see Run.train_game), gamma is per frame
+    actionRepeat = 1
+
+    # least-squares policy iteration (see LeastSquares), off while lspiEvery
+    # is 0: instead of a gradient step per frame the transitions are
+    # collected and the weights are solved for after every lspiEvery episodes
+    lspiEvery = 0
+    lspiIterations = 10
+    _lspi = None
+    _lspiEpisodes = 0
+
+    def __init__(self, seed=42):
+        # epsilon-greedy and tie-breaks, see Exploration
+        self._random = RandomStreams(seed)
+
+        self._thetaA0 = [0, 0, 0, 0]
+        self._thetaA1 = [0, 0, 0, 0]
         return
 
     def transfromState(self, s):
         return [s['next_pipe_top_y'], s['player_y'], s['player_vel'], s['next_pipe_dist_to_player']]
 
+    # the features of a state passed to the *Features methods (see Run.train_game)
+    featurize = transfromState
+
     def calcQA0(self, state):
         return np.dot(self._thetaA0, state)
 
@@ -41,28 +58,33 @@ class LFA:
             subsequent steps in the same episode. That is, s1 in the second call will be s2
             from the first call.
             """
+        self.observeFeatures(self.featurize(s1), a, r, None if end else self.featurize(s2), end)
+
+    def observeFeatures(self, f1, a, r, f2, end):
+        """ observe for the features of s1 and s2 (see featurize), f2 is None if end """
+        if self.lspiEvery:
+            self.observeLeastSquares(f1, a, r, f2, end)
+            return
+
         maxNextQ = 0
         if not end:
-            maskS2 = self.transfromState(s2)
-            qs2A0 = self.calcQA0(maskS2)
-            qs2A1 = self.calcQA1(maskS2)
+            qs2A0 = self.calcQA0(f2)
+            qs2A1 = self.calcQA1(f2)
             if (qs2A0 > qs2A1):
                 maxNextQ = qs2A0
             else:
                 maxNextQ = qs2A1
 
-        transformedS1 = self.transfromState(s1)
-
         if a == 0:
             theta = self._thetaA0
-            currentQ = self.calcQA0(transformedS1)
+            currentQ = self.calcQA0(f1)
         else:
             theta = self._thetaA1
-            currentQ = self.calcQA1(transformedS1)
+            currentQ = self.calcQA1(f1)
 
 
-        factor = self.alpha * (r + self.gamma * maxNextQ - currentQ)
-        newTheta = theta + np.multiply(transformedS1, factor)
+        factor = self.alpha * (r + self.gamma ** self.actionRepeat * maxNextQ - currentQ)
+        newTheta = theta + np.multiply(f1, factor)
 
         if a == 0:
             self._thetaA0 = newTheta
@@ -71,15 +93,31 @@ class LFA:
 
         return
 
+    def observeLeastSquares(self, f1, a, r, f2, end):
+        """ observeFeatures while lspiEvery is set """
+        if self._lspi is None:
+            self._lspi = solverFor(self)
+        self._lspi.add(f1, a, r, f2, 0 if end else self.gamma ** self.actionRepeat)
+        if end:
+            self._lspiEpisodes += 1
+            if self._lspiEpisodes % self.lspiEvery == 0:
+                theta = self._lspi.solve(self.lspiIterations)
+                self._thetaA0 = theta[0].tolist()
+                self._thetaA1 = theta[1].tolist()
+
     def training_policy(self, state):
         """ Returns the index of the action that should be done in state while training the agent.
             Possible actions in Flappy Bird are 0 (flap the wing) or 1 (do nothing).
 
             training_policy is called once per frame in the game while training
         """
-        if self.epsilon > random.random():
-            return random.randint(0, 1)
-        return self.policy(state)
+        return self.trainingPolicyFeatures(self.featurize(state))
+
+    def trainingPolicyFeatures(self, f):
+        """ training_policy for the features of the state (see featurize) """
+        if self.epsilon > self._random.uniform():
+            return self._random.bit()
+        return self.policyFeatures(f)
 
     def policy(self, state):
         """ Returns the index of the action that should be done in state when training is completed.
@@ -88,12 +126,15 @@ class LFA:
             policy is called once per frame in the game (30 times per second in real-time)
             and needs to be sufficiently fast to not slow down the game.
         """
-        transformedState = self.transfromState(state)
-        qAction0 = self.calcQA0(transformedState)
-        qAction1 = self.calcQA1(transformedState)
+        return self.policyFeatures(self.featurize(state))
+
+    def policyFeatures(self, f):
+        """ policy for the features of the state (see featurize) """
+        qAction0 = self.calcQA0(f)
+        qAction1 = self.calcQA1(f)
 
         if qAction0 == qAction1:
-            return random.randint(0, 1)
+            return self._random.bit()
         if qAction0 > qAction1:
             return 0
         return 1
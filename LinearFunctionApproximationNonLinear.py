@@ -1,121 +1,62 @@
-import random
-import numpy as np
+from AgentState import AgentState
+from Discretizer import Discretizer
+from Exploration import RandomStreams
+from LeastSquares import solverFor
 
-class LFA:
+class LFA(AgentState):
     alpha = 0.1
     gamma = 1
     epsilon = 0.1
-
-    _thetaA0 = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-    _thetaA1 = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-
-    def __init__(self):
-        random.seed(42)
-
+    # frames each decision lasts (see Run.train_game), gamma is per frame
+    actionRepeat = 1
+
+    # least-squares policy iteration (see LeastSquares), off while lspiEvery
+    # is 0: instead of a gradient step per frame the transitions are
+    # collected and the weights are solved for after every lspiEvery episodes
+    lspiEvery = 0
+    lspiIterations = 10
+    _lspi = None
+    _lspiEpisodes = 0
+
+    # the state is encoded as one bin of each of these components (18 + 9 + 16
+    # one-hot features), see Discretizer. Only the indices of the active
+    # features are computed, so the cost per frame does not depend on the
+    # number of bins.
+    stateSpec = (
+        ('delta_y', "s['player_y'] - s['next_pipe_top_y']",
+         (-250, -150, -110, -80, -50, -20, 0, 20, 40, 60, 80, 100, 120, 150, 180, 250, 350)),
+        ('player_vel', "s['player_vel'] / 2", (-3, -2, -1, 0, 1, 2, 3, 4)),
+        ('distance', "s['next_pipe_dist_to_player'] * 15 / 288",
+         (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15)),
+    )
+    _discretizer = Discretizer(stateSpec)
+    transfromState, nbFeatures = _discretizer.oneHot()
+    transfromState = staticmethod(transfromState)
+    # the features of a state passed to the *Features methods (see Run.train_game)
+    featurize = transfromState
+
+    def __init__(self, seed=42):
+        # epsilon-greedy and tie-breaks, see Exploration
+        self._random = RandomStreams(seed)
+
+        # updated in place, so every agent needs its own weights
+        self._thetaA0 = [0.0] * self.nbFeatures
+        self._thetaA1 = [0.0] * self.nbFeatures
         return
 
-    def transfromState(self, s):
-        features = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        delta_y = s['player_y'] - s['next_pipe_top_y']
-        if delta_y < -250:
-            features[0] = 1
-        elif delta_y < -150:
-            features[1] = 1
-        elif delta_y < -110:
-            features[2] = 1
-        elif delta_y < -80:
-            features[3] = 1
-        elif delta_y < -50:
-            features[4] = 1
-        elif delta_y < -20:
-            features[5] = 1
-        elif delta_y < 0:
-            features[6] = 1
-        elif delta_y < 20:
-            features[7] = 1
-        elif delta_y < 40:
-            features[8] = 1
-        elif delta_y < 60:
-            features[9] = 1
-        elif delta_y < 80:
-            features[10] = 1
-        elif delta_y < 100:
-            features[11] = 1
-        elif delta_y < 120:
-            features[12] = 1
-        elif delta_y < 150:
-            features[13] = 1
-        elif delta_y < 180:
-            features[14] = 1
-        elif delta_y < 250:
-            features[15] = 1
-        elif delta_y < 350:
-            features[16] = 1
-        else:
-            features[17] = 1
-
-        player_vel = s['player_vel'] / 2
-        if player_vel < -3:
-            features[18] = 1
-        elif player_vel < -2:
-            features[19] = 1
-        elif player_vel < -1:
-            features[20] = 1
-        elif player_vel < 0:
-            features[21] = 1
-        elif player_vel < 1:
-            features[22] = 1
-        elif player_vel < 2:
-            features[23] = 1
-        elif player_vel < 3:
-            features[24] = 1
-        elif player_vel < 4:
-            features[25] = 1
-        else:
-            features[26] = 1
-
-        distance = s['next_pipe_dist_to_player'] * 15 / 288
-
-        if distance < 1:
-            features[27] = 1
-        elif distance < 2:
-            features[28] = 1
-        elif distance < 3:
-            features[29] = 1
-        elif distance < 4:
-            features[30] = 1
-        elif distance < 5:
-            features[31] = 1
-        elif distance < 6:
-            features[32] = 1
-        elif distance < 7:
-            features[33] = 1
-        elif distance < 8:
-            features[34] = 1
-        elif distance < 9:
-            features[35] = 1
-        elif distance < 10:
-            features[36] = 1
-        elif distance < 11:
-            features[37] = 1
-        elif distance < 12:
-            features[38] = 1
-        elif distance < 13:
-            features[39] = 1
-        elif distance < 14:
-            features[40] = 1
-        elif distance < 15:
-            features[41] = 1
-        else:
-            features[42] = 1
-
-        return features
-
     def calcQA0(self, state):
-        return np.dot(self._thetaA0, state)
+        theta = self._thetaA0
+        q = 0.0
+        for i in state:
+            q += theta[i]
+        return q
 
     def calcQA1(self, state):
-        return np.dot(self._thetaA1, state)
+        theta = self._thetaA1
+        q = 0.0
+        for i in state:
+            q += theta[i]
+        return q
 
     def reward_values(self):
         """ returns the reward values used for training
@@ -136,45 +77,63 @@ class LFA:
             subsequent steps in the same episode. That is, s1 in the second call will be s2
             from the first call.
             """
+        self.observeFeatures(self.featurize(s1), a, r, None if end else self.featurize(s2), end)
+
+    def observeFeatures(self, f1, a, r, f2, end):
+        """ observe for the features of s1 and s2 (see featurize), f2 is None if end """
+        if self.lspiEvery:
+            self.observeLeastSquares(f1, a, r, f2, end)
+            return
+
         maxNextQ = 0
         if not end:
-            maskS2 = self.transfromState(s2)
-            qs2A0 = self.calcQA0(maskS2)
-            qs2A1 = self.calcQA1(maskS2)
+            qs2A0 = self.calcQA0(f2)
+            qs2A1 = self.calcQA1(f2)
             if (qs2A0 > qs2A1):
                 maxNextQ = qs2A0
             else:
                 maxNextQ = qs2A1
 
-        transformedS1 = self.transfromState(s1)
-
         if a == 0:
             theta = self._thetaA0
-            currentQ = self.calcQA0(transformedS1)
+            currentQ = self.calcQA0(f1)
         else:
             theta = self._thetaA1
-            currentQ = self.calcQA1(transformedS1)
+            currentQ = self.calcQA1(f1)
 
 
-        factor = self.alpha * (r + self.gamma * maxNextQ - currentQ)
-        newTheta = theta + np.multiply(transformedS1, factor)
-
-        if a == 0:
-            self._thetaA0 = newTheta
-        else:
-            self._thetaA1 = newTheta
+        factor = self.alpha * (r + self.gamma ** self.actionRepeat * maxNextQ - currentQ)
+        # the gradient is 1 for the active features and 0 for all others
+        for i in f1:
+            theta[i] += factor
 
         return
 
+    def observeLeastSquares(self, f1, a, r, f2, end):
+        """ observeFeatures while lspiEvery is set """
+        if self._lspi is None:
+            self._lspi = solverFor(self)
+        self._lspi.add(f1, a, r, f2, 0 if end else self.gamma ** self.actionRepeat)
+        if end:
+            self._lspiEpisodes += 1
+            if self._lspiEpisodes % self.lspiEvery == 0:
+                theta = self._lspi.solve(self.lspiIterations)
+                self._thetaA0 = theta[0].tolist()
+                self._thetaA1 = theta[1].tolist()
+
     def training_policy(self, state):
         """ Returns the index of the action that should be done in state while training the agent.
             Possible actions in Flappy Bird are 0 (flap the wing) or 1 (do nothing).
 
             training_policy is called once per frame in the game while training
         """
-        if self.epsilon > random.random():
-            return random.randint(0, 1)
-        return self.policy(state)
+        return self.trainingPolicyFeatures(self.featurize(state))
+
+    def trainingPolicyFeatures(self, f):
+        """ training_policy for the features of the state (see featurize) """
+        if self.epsilon > self._random.uniform():
+            return self._random.bit()
+        return self.policyFeatures(f)
 
     def policy(self, state):
         """ Returns the index of the action that should be done in state when training is completed.
@@ -183,12 +142,15 @@ class LFA:
             policy is called once per frame in the game (30 times per second in real-time)
             and needs to be sufficiently fast to not slow down the game.
         """
-        transformedState = self.transfromState(state)
-        qAction0 = self.calcQA0(transformedState)
-        qAction1 = self.calcQA1(transformedState)
+        return self.policyFeatures(self.featurize(state))
+
+    def policyFeatures(self, f):
+        """ policy for the features of the state (see featurize) """
+        qAction0 = self.calcQA0(f)
+        qAction1 = self.calcQA1(f)
 
         if qAction0 == qAction1:
-            return random.randint(0, 1)
+            return self._random.bit()
         if qAction0 > qAction1:
             return 0
         return 1
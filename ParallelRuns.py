@@ -0,0 +1,123 @@
+import multiprocessing
+import sys
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def _trainRun(job):
+    """ trains one agent in a worker process and returns its scores and the
+        learned q-table (or theta for LFA)
+    """
+    agentClass, seed, nb_episodes, simulator = job
+    import Run
+
+    agent = agentClass(seed)
+    np.random.seed(seed)
+    # the score of every episode, Run's ScoreStats only keeps the last ones
+    scores = []
+    if simulator:
+        # agents that need their episodes in order play one game at a time
+        Run.train_game_vectorized(nb_episodes, agent, nb_envs=1 if getattr(agent, 'orderedEpisodes', False) else 64,
+                                  rng=seed, scores=scores)
+    else:
+        Run.train_game(nb_episodes, agent, rng=seed, scores=scores)
+
+    result = {'agent': agentClass.__name__, 'seed': seed,
+              'scores': np.array(scores[:nb_episodes])}
+    if hasattr(agent, '_thetaA0'):
+        result['theta'] = (np.array(agent._thetaA0, dtype=np.float64),
+                           np.array(agent._thetaA1, dtype=np.float64))
+    elif hasattr(agent._q, 'table'):
+        result['q'] = agent._q.table.copy()
+    else:
+        result['q'] = dict((s, list(v)) for s, v in agent._q.items())
+    return result
+
+
+def train_runs(agentClasses, seeds, nb_episodes, processes=None, simulator=False):
+    """ trains every agent class once for every seed, each run in its own worker
+        process (processes defaults to the number of cores). With simulator=True
+        the runs use train_game_vectorized instead of PLE (with a single game
+        at a time for the agents that need their episodes in order).
+
+        Returns one dict per run with the keys 'agent', 'seed', 'scores' (one
+        per episode) and 'q' or 'theta'.
+    """
+    jobs = [(agentClass, seed, nb_episodes, simulator) for agentClass in agentClasses for seed in seeds]
+    # every agent has its own state (see AgentState), a worker process can
+    # train one run after the other
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_trainRun, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def learningCurves(results, window=100, confidence=0.95):
+    """ averages the scores of each run over blocks of window episodes and
+        aggregates the runs of each agent.
+
+        Returns { agent name: (episodes, mean, lower, upper) } where lower and
+        upper are the bounds of the confidence interval of the mean over the
+        seeds (student-t).
+    """
+    from scipy import stats
+
+    curves = {}
+    for name in sorted(set(r['agent'] for r in results)):
+        runs = [r['scores'] for r in results if r['agent'] == name]
+        blocks = min(len(scores) for scores in runs) // window
+        averages = np.array([scores[:blocks * window].reshape(blocks, window).mean(axis=1) for scores in runs])
+        mean = averages.mean(axis=0)
+        if len(runs) > 1:
+            halfWidth = stats.t.ppf(0.5 + confidence / 2, len(runs) - 1) * averages.std(axis=0, ddof=1) / np.sqrt(len(runs))
+        else:
+            halfWidth = np.zeros(blocks)
+        episodes = np.arange(1, blocks + 1) * window
+        curves[name] = (episodes, mean, mean - halfWidth, mean + halfWidth)
+    return curves
+
+
+def episodesToThreshold(results, threshold, window=100):
+    """ the number of episodes each run needed until the average score of
+        its last window episodes reached threshold (None if it never did).
+
+        Returns { agent name: [episodes of each run] }.
+    """
+    counts = {}
+    for r in results:
+        scores = np.asarray(r['scores'], dtype=float)
+        sums = np.cumsum(np.concatenate(([0.0], scores)))
+        averages = (sums[window:] - sums[:-window]) / window
+        reached = np.flatnonzero(averages >= threshold)
+        counts.setdefault(r['agent'], []).append(int(reached[0]) + window if len(reached) else None)
+    return counts
+
+
+def plotLearningCurves(curves):
+    plt.figure()
+    for name, (episodes, mean, lower, upper) in sorted(curves.items()):
+        line, = plt.plot(episodes, mean, linewidth=2, label=name)
+        plt.fill_between(episodes, lower, upper, color=line.get_color(), alpha=0.2)
+    plt.legend(loc='best')
+    plt.xlabel("Episodes")
+    plt.ylabel("Average score")
+    plt.show()
+
+
+if __name__ == '__main__':
+    from QLearningAgent import QLearingAgent
+    from MonteCarloAgent import MCAgent
+    from AgentBest import AgentBest
+    from QLambdaAgent import QLambdaAgent, SarsaLambdaAgent
+
+    nb_episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    results = train_runs([QLearingAgent, MCAgent, AgentBest, QLambdaAgent, SarsaLambdaAgent], range(8), nb_episodes)
+    for name, counts in sorted(episodesToThreshold(results, threshold).items()):
+        reached = [c for c in counts if c is not None]
+        print("%s: %d of %d runs reached an average score of %g, median %s episodes"
+              % (name, len(reached), len(counts), threshold, np.median(reached) if reached else '-'))
+    plotLearningCurves(learningCurves(results, window=max(1, nb_episodes // 20)))
@@ -0,0 +1,76 @@
+import cProfile
+import timeit
+
+
+class PhaseProfiler:
+    """ Accumulates the wall time spent in the phases of a game loop
+        (env.act, getGameState, the agent's methods, ...).
+
+        wrap(name, function) returns function timed under name. The loops in
+        Run.py call the phases through local names that are only replaced by
+        the wrapped functions when profiling, so there is no cost when it is
+        off. The time of the loop itself is what remains of the wall time.
+
+        With cProfileFile the whole run is also recorded by cProfile and the
+        stats are dumped to that file (read them with pstats) by close().
+    """
+
+    def __init__(self, cProfileFile=None, clock=timeit.default_timer):
+        self.clock = clock
+        self.totals = {}
+        self.calls = {}
+        self.cProfileFile = cProfileFile
+        self._cProfile = None
+        if cProfileFile is not None:
+            self._cProfile = cProfile.Profile()
+            self._cProfile.enable()
+        self._start = self._windowStart = clock()
+        self._windowFrames = 0
+
+    def wrap(self, name, function, endName=None):
+        """ times the calls of function under name. With endName, calls whose
+            last argument (the end flag of observe) is true are timed under
+            endName instead, which separates the work done at the end of an
+            episode.
+        """
+        clock = self.clock
+        totals = self.totals
+        calls = self.calls
+        for phase in (name, endName):
+            if phase is not None:
+                totals.setdefault(phase, 0.0)
+                calls.setdefault(phase, 0)
+
+        def timed(*args):
+            start = clock()
+            result = function(*args)
+            phase = endName if endName is not None and args[-1] else name
+            totals[phase] += clock() - start
+            calls[phase] += 1
+            return result
+        return timed
+
+    def report(self, frames):
+        """ prints the time per phase since the start and the frames per
+            second since the last report, frames is the number of frames so far
+        """
+        now = self.clock()
+        elapsed = now - self._start
+        fps = (frames - self._windowFrames) / max(now - self._windowStart, 1e-9)
+        self._windowStart = now
+        self._windowFrames = frames
+
+        print("%.0f frames/s (%d frames in %.1f s)" % (fps, frames, elapsed))
+        phases = sorted(self.totals.items(), key=lambda item: item[1], reverse=True)
+        phases.append(('loop', elapsed - sum(self.totals.values())))
+        for name, total in phases:
+            perCall = total / self.calls[name] * 1e6 if self.calls.get(name) else 0.0
+            print("    %-22s %8.2f s %5.1f%% %8.2f us/call"
+                  % (name, total, 100.0 * total / max(elapsed, 1e-9), perCall))
+
+    def close(self):
+        """ stops cProfile and writes its stats """
+        if self._cProfile is not None:
+            self._cProfile.disable()
+            self._cProfile.dump_stats(self.cProfileFile)
+            self._cProfile = None
@@ -0,0 +1,123 @@
+import numpy as np
+
+from AgentCore import TabularAgent
+from QLearningAgent import QLearingAgent
+
+class QLambdaAgent(QLearingAgent):
+    """ Watkins' Q(lambda): q-learning whose updates also reach the recently
+        visited state-action pairs through eligibility traces, so the reward
+        of a pipe (or a crash) propagates back along the whole path that led
+        to it instead of one state per visit. With onPolicy = True it is
+        SARSA(lambda) (see SarsaLambdaAgent).
+
+        The traces are kept as a sparse set: the flat q-table indices and the
+        traces of the pairs whose trace is at least traceThreshold, so the
+        cost of a step is proportional to the number of traced pairs
+        (at most log(traceThreshold) / log(gamma * traceLambda)), never to
+        the size of the table.
+
+        An update needs the next action (the target of SARSA, and Q(lambda)
+        cuts the traces after an exploratory action), which is the action of
+        the next call of observe. So every transition is completed by the
+        next call, or right away if it ends the episode. Like MCAgent this
+        needs the transitions of an episode in order (train_game, not
+        train_game_vectorized).
+
+        Everything else (the discretization of QLearingAgent, the policies
+        and reward_values) is TabularAgent's.
+    """
+    traceLambda = 0.9
+    traceThreshold = 0.01
+    onPolicy = False
+    # observeFeatures is the one below, not picked by tabular
+    update = None
+    orderedEpisodes = True
+
+    def __init__(self, seed=42):
+        TabularAgent.__init__(self, seed)
+
+        # the traced pairs: flat q-table index and trace, the first _traceCount
+        # entries are used, grown by doubling when full
+        self._traceIndices = np.zeros(256, dtype=np.int64)
+        self._traceValues = np.zeros(256)
+        self._traceCount = 0
+        # (features, action, reward) of the transition that waits for the next action
+        self._pending = None
+        return
+
+    def observeFeatures(self, f1, a, r, f2, end):
+        """ observe for the features of s1 and s2 (see featurize), f2 is None if end """
+        # a is the next action of the waiting transition, which ended in f1
+        if self._pending is not None:
+            pendingF1, pendingA, pendingR = self._pending
+            self._update(pendingF1 + pendingA, pendingR, f1, a)
+        if end:
+            self._update(f1 + a, r, None, None)
+            self._traceCount = 0
+            self._pending = None
+        else:
+            self._pending = (f1, a, r)
+        return
+
+    def _update(self, i1, r, f2, a2):
+        """ the update of the transition from flat index i1 (state and action)
+            with reward r to the state with features f2 (None if terminal)
+            where a2 is done next
+        """
+        q = self._q
+        flat = q.flat
+        decay = self.gamma ** self.actionRepeat
+
+        greedy = True
+        target = r
+        if f2 is not None:
+            qS2A0 = flat[f2]
+            qS2A1 = flat[f2 + 1]
+            maxNextQ = qS2A0 if qS2A0 > qS2A1 else qS2A1
+            if self.onPolicy:
+                target += decay * flat[f2 + a2]
+            else:
+                target += decay * maxNextQ
+                greedy = flat[f2 + a2] == maxNextQ
+        delta = target - flat[i1]
+
+        # replacing traces: the pair gets trace 1, the other action of its
+        # state loses its trace
+        n = self._traceCount
+        indices = self._traceIndices[:n]
+        values = self._traceValues[:n]
+        if n:
+            keep = (indices >> 1) != (i1 >> 1)
+            if not keep.all():
+                n = np.count_nonzero(keep)
+                indices[:n] = indices[keep]
+                values[:n] = values[keep]
+        if n == len(self._traceIndices):
+            self._traceIndices = np.concatenate((self._traceIndices, np.zeros_like(self._traceIndices)))
+            self._traceValues = np.concatenate((self._traceValues, np.zeros_like(self._traceValues)))
+        self._traceIndices[n] = i1
+        self._traceValues[n] = 1.0
+        n += 1
+        indices = self._traceIndices[:n]
+        values = self._traceValues[:n]
+
+        q.values[indices] += self.alpha * delta * values
+        q.visited[i1 >> 1] = 1
+
+        if not greedy:
+            self._traceCount = 0
+            return
+        values *= decay * self.traceLambda
+        keep = values >= self.traceThreshold
+        if not keep.all():
+            n = np.count_nonzero(keep)
+            indices[:n] = indices[keep]
+            values[:n] = values[keep]
+        self._traceCount = n
+
+
+class SarsaLambdaAgent(QLambdaAgent):
+    """ SARSA(lambda): QLambdaAgent learning the values of its epsilon-greedy
+        policy, the target is the q-value of the action actually done next
+    """
+    onPolicy = True
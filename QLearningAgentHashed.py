@@ -0,0 +1,20 @@
+from AgentCore import TabularAgent, tabular
+from QTable import HashedQTable
+
+@tabular
+class QLearingAgentHashed(TabularAgent):
+    alpha = 0.1
+    gamma = 1
+    epsilon = 0.1
+
+    # components of the discretized state, see Discretizer. Too fine for a
+    # DenseQTable (tens of millions of states), most of them are never visited
+    stateSpec = (
+        ('next_pipe_top_y', "s['next_pipe_top_y'] / 4", None),
+        ('player_y', "s['player_y'] / 4", None),
+        ('player_vel', "s['player_vel']", None),
+        ('next_pipe_dist_to_player', "s['next_pipe_dist_to_player'] / 4", None),
+    )
+    # q-values of at most ~200000 states in 16 MB, the least recently updated
+    # states are evicted when it is full
+    qStore = staticmethod(lambda stateBounds: HashedQTable.withBudget(16 * 2 ** 20))
@@ -0,0 +1,492 @@
+import array
+import random
+import timeit
+from collections import defaultdict
+
+import numpy as np
+
+
+class DenseQTable:
+    """ Q-table stored as one preallocated array of shape (dim1, ..., dimN, 2).
+
+        bounds is a list of (low, high) pairs (both inclusive), one for each
+        component of the discretized state tuple. The values are kept in a flat
+        array.array (self.flat) so the per-frame code can read and write single
+        entries as plain python floats. self.table (and the 1-d self.values)
+        are numpy views on the same memory for everything that works on many
+        entries at once.
+
+        The discretized states must stay inside bounds, they are not clipped:
+        index (and so the dict-like access) raises an IndexError for a state
+        outside of them, the compiled indexers of the agents (see
+        Discretizer.indexer) rely on the bounds checked by AgentCore.tabular.
+
+        values and visited can be given as existing 1-d numpy arrays (e.g.
+        np.memmap of a checkpoint, see Checkpoint.py) which are then used
+        without a copy instead of allocating the table.
+    """
+
+    def __init__(self, bounds, dtype='d', values=None, visited=None):
+        self.bounds = tuple((int(low), int(high)) for low, high in bounds)
+        self.shape = tuple(high - low + 1 for low, high in self.bounds)
+
+        size = 2
+        strides = []
+        for dim in reversed(self.shape):
+            strides.insert(0, size)
+            size *= dim
+        self.strides = tuple(strides)
+
+        if values is None:
+            self.flat = array.array(dtype, [0]) * size
+            self.values = np.frombuffer(self.flat, dtype=dtype)
+            # one byte per state, set whenever one of its q-values gets written
+            self.visited = bytearray(size // 2)
+            self._visitedArray = np.frombuffer(self.visited, dtype=np.uint8)
+        else:
+            if len(values) != size or len(visited) != size // 2:
+                raise ValueError("arrays of size %d and %d do not fit bounds %s"
+                                 % (len(values), len(visited), self.bounds))
+            self.flat = self.values = values
+            self.visited = self._visitedArray = visited
+        self.table = self.values.reshape(self.shape + (2,))
+
+        # index() is compiled into a single expression instead of looping over
+        # the dimensions
+        base = -sum(low * stride for (low, high), stride in zip(self.bounds, self.strides))
+        terms = ''.join(' + s[%d] * %d' % (i, stride) for i, stride in enumerate(self.strides))
+        inside = ' and '.join('%d <= s[%d] <= %d' % (low, i, high) for i, (low, high) in enumerate(self.bounds))
+        self.index = eval('lambda s: %d%s if len(s) == %d and %s else outside(s)'
+                          % (base, terms, len(self.bounds), inside), {'outside': self._outside})
+
+    def _outside(self, state):
+        raise IndexError("state %r is outside of the bounds %s" % (tuple(state), self.bounds))
+
+    def write(self, i, value):
+        """ sets the q-value at flat index i (index(state) + action) """
+        self.flat[i] = value
+        self.visited[i >> 1] = 1
+
+    def writeMany(self, indices, values):
+        """ sets the q-values at an array of (distinct) flat indices """
+        self.values[indices] = values
+        self._visitedArray[indices >> 1] = 1
+
+    def keys(self):
+        """ returns the discretized states that have been written so far """
+        rows = np.nonzero(self._visitedArray)[0]
+        lows = [low for low, high in self.bounds]
+        return [tuple(int(v) + low for v, low in zip(idx, lows))
+                for idx in zip(*np.unravel_index(rows, self.shape))]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, state):
+        return self.visited[self.index(state) >> 1] == 1
+
+    def __getitem__(self, state):
+        """ returns the two q-values of state as a writable view """
+        i = self.index(state)
+        return self.values[i:i + 2]
+
+    def __setitem__(self, state, values):
+        i = self.index(state)
+        self.write(i, values[0])
+        self.write(i + 1, values[1])
+
+    def items(self):
+        return [(s, self[s]) for s in self.keys()]
+
+    def clear(self):
+        self.table.fill(0)
+        self._visitedArray.fill(0)
+
+    def copy(self):
+        """ a new table with the same values, in memory of its own """
+        q = DenseQTable(self.bounds, self.values.dtype.char)
+        q.values[:] = self.values
+        q._visitedArray[:] = self._visitedArray
+        return q
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def update(self, q):
+        """ loads a { state: [q(s,flap), q(s,noop)] } dictionary into the table """
+        for state, values in q.items():
+            self[state] = values
+
+
+class HashedQTable:
+    """ Q-table for discretizations too fine for a DenseQTable: at most
+        capacity states, keyed by their discretized state packed into one
+        integer (see Discretizer.packer), in a hash table with open addressing
+        (linear probing) whose size is a prime, so key % size spreads the
+        packed components over all slots. All memory is allocated up front in flat arrays:
+
+        - _keys: the key in each slot, EMPTY if the slot is free
+        - flat: the two q-values of each slot at 2 * slot, followed by a pair
+          that is always 0 and read for states that are not in the table
+        - _newer, _older: the slots in the order they were last written, a
+          doubly linked list from _oldest to _newest
+
+        find never inserts, only write does. When all capacity entries are in
+        use, write evicts the least recently written state. At most maxLoad of
+        the slots are used, so the probe sequences stay short.
+    """
+
+    EMPTY = -1
+    # bytes per slot: key, two q-values and two links
+    SLOT_BYTES = 40
+
+    def __init__(self, capacity, maxLoad=0.5):
+        if not 0 < maxLoad < 1:
+            raise ValueError("maxLoad has to be between 0 and 1, not %r" % maxLoad)
+        # the keys are 63 bit and the arrays are shared with numpy as int64,
+        # python 2's array module has no 'q' typecode
+        if array.array('l').itemsize != 8:
+            raise ValueError("HashedQTable needs 8 byte longs (array typecode 'l'), they have %d bytes here"
+                             % array.array('l').itemsize)
+        size = _prime(int(capacity / maxLoad) + 1)
+        self.capacity = int(capacity)
+        self.maxLoad = maxLoad
+        self.size = size
+        self._keys = array.array('l', [self.EMPTY]) * size
+        self.flat = array.array('d', [0]) * (2 * size + 2)
+        self.values = np.frombuffer(self.flat, dtype='d')
+        self.missing = 2 * size
+        self._newer = array.array('l', [-1]) * size
+        self._older = array.array('l', [-1]) * size
+        self.clear()
+
+    @staticmethod
+    def withBudget(nbytes, maxLoad=0.5):
+        """ the table with the largest capacity whose arrays fit in nbytes """
+        slots = (nbytes - 16) // HashedQTable.SLOT_BYTES
+        capacity = int(slots * maxLoad)
+        while capacity > 1 and _prime(int(capacity / maxLoad) + 1) > slots:
+            capacity -= 1
+        return HashedQTable(max(1, capacity), maxLoad)
+
+    def clear(self):
+        for a in (self._keys, self._newer, self._older):
+            np.frombuffer(a, dtype=np.int64).fill(-1)
+        self.values.fill(0)
+        self._newest = self._oldest = -1
+        self.count = 0
+        self.inserts = 0
+        self.evictions = 0
+
+    def find(self, key):
+        """ returns the index in flat of the q-values of key (2 * its slot),
+            or missing (two zeros) if key is not in the table
+        """
+        keys = self._keys
+        size = self.size
+        slot = key % size
+        while True:
+            k = keys[slot]
+            if k == key:
+                return 2 * slot
+            if k == -1:
+                return self.missing
+            slot += 1
+            if slot == size:
+                slot = 0
+
+    def write(self, key, action, value):
+        """ sets q(key, action), inserting key (and evicting the least recently
+            written state if the table is full) if it is not in the table
+        """
+        self.flat[self.writeIndex(key) + action] = value
+
+    def writeIndex(self, key):
+        """ returns the index in flat of the q-values of key like find, but
+            inserts key if it is not in the table (its q-values are 0) and
+            makes it the most recently written state: write with a single
+            probe sequence for a read-modify-write
+        """
+        keys = self._keys
+        size = self.size
+        slot = key % size
+        while True:
+            k = keys[slot]
+            if k == key:
+                newest = self._newest
+                if slot != newest:
+                    # _unlink and _linkNewest, inlined
+                    newerLinks = self._newer
+                    olderLinks = self._older
+                    newer = newerLinks[slot]
+                    older = olderLinks[slot]
+                    olderLinks[newer] = older
+                    if older == -1:
+                        self._oldest = newer
+                    else:
+                        newerLinks[older] = newer
+                    olderLinks[slot] = newest
+                    newerLinks[slot] = -1
+                    newerLinks[newest] = slot
+                    self._newest = slot
+                return 2 * slot
+            if k == -1:
+                if self.count == self.capacity:
+                    # the removal can move entries into the probe sequence of key
+                    self._remove(self._oldest)
+                    self.evictions += 1
+                    return self.writeIndex(key)
+                keys[slot] = key
+                self.flat[2 * slot] = self.flat[2 * slot + 1] = 0.0
+                self._linkNewest(slot)
+                self.count += 1
+                self.inserts += 1
+                return 2 * slot
+            slot += 1
+            if slot == size:
+                slot = 0
+
+    def _unlink(self, slot):
+        newer = self._newer[slot]
+        older = self._older[slot]
+        if newer == -1:
+            self._newest = older
+        else:
+            self._older[newer] = older
+        if older == -1:
+            self._oldest = newer
+        else:
+            self._newer[older] = newer
+
+    def _linkNewest(self, slot):
+        self._older[slot] = self._newest
+        self._newer[slot] = -1
+        if self._newest == -1:
+            self._oldest = slot
+        else:
+            self._newer[self._newest] = slot
+        self._newest = slot
+
+    def _remove(self, slot):
+        """ frees slot and moves the following entries of its cluster back so
+            that no probe sequence has a gap (no tombstones needed)
+        """
+        keys = self._keys
+        size = self.size
+        self._unlink(slot)
+        keys[slot] = -1
+        self.count -= 1
+        hole = slot
+        j = slot
+        while True:
+            j = (j + 1) % size
+            k = keys[j]
+            if k == -1:
+                return
+            # the entry can fill the hole if the hole lies between its home and j
+            if (j - k % size) % size >= (j - hole) % size:
+                self._move(j, hole)
+                hole = j
+
+    def _move(self, source, target):
+        flat = self.flat
+        self._keys[target] = self._keys[source]
+        self._keys[source] = -1
+        flat[2 * target] = flat[2 * source]
+        flat[2 * target + 1] = flat[2 * source + 1]
+        newer = self._newer[target] = self._newer[source]
+        older = self._older[target] = self._older[source]
+        if newer == -1:
+            self._newest = target
+        else:
+            self._older[newer] = target
+        if older == -1:
+            self._oldest = target
+        else:
+            self._newer[older] = target
+
+    def __contains__(self, key):
+        return self.find(key) != self.missing
+
+    def __len__(self):
+        return self.count
+
+    def keys(self):
+        """ the keys in the table, from the least to the most recently written """
+        keys = []
+        slot = self._oldest
+        while slot != -1:
+            keys.append(self._keys[slot])
+            slot = self._newer[slot]
+        return keys
+
+    def __getitem__(self, key):
+        """ returns the two q-values of key (a copy, zeros if it is not in the table) """
+        i = self.find(key)
+        return self.flat[i:i + 2]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    @property
+    def nbytes(self):
+        return self.SLOT_BYTES * self.size + 16
+
+    def snapshot(self):
+        """ (header, arrays) with everything restore needs, see Checkpoint """
+        header = {'capacity': self.capacity, 'maxLoad': self.maxLoad, 'newest': self._newest,
+                  'oldest': self._oldest, 'count': self.count, 'inserts': self.inserts,
+                  'evictions': self.evictions}
+        arrays = [('q', np.array(self.values, dtype='<f8'))]
+        for name in ('_keys', '_newer', '_older'):
+            arrays.append(('hash' + name[1:].capitalize(), np.array(getattr(self, name), dtype='<i8')))
+        return header, arrays
+
+    def restore(self, header, arrays):
+        """ loads a snapshot of a table with the same capacity and maxLoad """
+        if header['capacity'] != self.capacity or header['maxLoad'] != self.maxLoad:
+            raise ValueError("a table of capacity %d (maxLoad %g) does not fit capacity %d (maxLoad %g)"
+                             % (header['capacity'], header['maxLoad'], self.capacity, self.maxLoad))
+        self.values[:] = arrays['q']
+        for name in ('_keys', '_newer', '_older'):
+            np.frombuffer(getattr(self, name), dtype=np.int64)[:] = arrays['hash' + name[1:].capitalize()]
+        self._newest = header['newest']
+        self._oldest = header['oldest']
+        self.count = header['count']
+        self.inserts = header['inserts']
+        self.evictions = header['evictions']
+
+    def copy(self):
+        q = HashedQTable(self.capacity, self.maxLoad)
+        header, arrays = self.snapshot()
+        q.restore(header, dict(arrays))
+        return q
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def stats(self):
+        """ how full the table is and how often states were evicted, shown by
+            Run's menu (8)
+        """
+        return {'capacity': self.capacity, 'entries': self.count, 'slots': self.size,
+                'loadFactor': float(self.count) / self.size, 'inserts': self.inserts,
+                'evictions': self.evictions, 'bytes': self.nbytes}
+
+
+def _prime(n):
+    """ the smallest prime >= n """
+    n = max(n, 2)
+    while any(n % d == 0 for d in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+class _DictQLearningAgent:
+    """ observe and policy of QLearingAgent before the DenseQTable, for benchmark """
+
+    def __init__(self):
+        self._q = defaultdict(lambda: [0, 0])
+
+    def discretizeState(self, s):
+        return (int(s['next_pipe_top_y'] * 15 / 512), int(s['player_y'] * 15 / 512),
+                int(s['player_vel'] * 15 / 19), int(s['next_pipe_dist_to_player'] * 15 / 288))
+
+    def observe(self, s1, a, r, s2, end):
+        maskS1 = self.discretizeState(s1)
+        currentQ = self._q[maskS1][a]
+        maxNextQ = 0
+        if not end:
+            qState2 = self._q[self.discretizeState(s2)]
+            maxNextQ = qState2[0] if qState2[0] > qState2[1] else qState2[1]
+        self._q[maskS1][a] = currentQ + 0.1 * (r + maxNextQ - currentQ)
+
+    def policy(self, state):
+        qValues = self._q[self.discretizeState(state)]
+        if qValues[0] == qValues[1]:
+            return random.randint(0, 1)
+        if qValues[0] > qValues[1]:
+            return 0
+        return 1
+
+
+def benchmark(nb_steps=100000):
+    """ measures the time of one frame of training (observe the transition,
+        then pick the action in the next state) of the whole agent, on
+        nb_steps transitions of the simulator played by a simple heuristic:
+
+        - dict: the original QLearingAgent (see _DictQLearningAgent)
+        - dense: QLearingAgent, the same states in a DenseQTable
+        - hashed: QLearingAgentHashed, a finer discretization in a
+          HashedQTable
+        - dense/hashed featurized: the same agents the way Run.train_game
+          drives them, through observeFeatures and policyFeatures
+
+        All but the featurized ones go through observe and policy on the raw
+        states, like PLE's training loop.
+
+        The first pass starts with an empty table, the warm passes repeat
+        the transitions on the trained table. Warm, in ns per frame on one
+        machine (python 2.7, numpy 1.16): dict 2600, dense 1850, hashed 2850,
+        dense featurized 1600, hashed featurized 2600. The dense table is
+        about 1.4x (1.6x featurized) faster than the dict, the hashed one is
+        no faster than the dict: it buys its finer states and bounded memory
+        with a probe sequence and the recency links on every write.
+    """
+    from FlappyBirdSim import VectorFlappyBird
+    from QLearningAgent import QLearingAgent
+    from QLearningAgentHashed import QLearingAgentHashed
+
+    rng = np.random.RandomState(42)
+    sim = VectorFlappyBird(1, rng=42)
+    # the s2 of a transition is the s1 of the next one, like in the game
+    s1 = sim.getGameStates()[0]
+    transitions = []
+    for frame in range(nb_steps):
+        a = 0 if s1['player_y'] > s1['next_pipe_bottom_y'] - 40 else 1
+        if rng.rand() < 0.1:
+            a = rng.randint(2)
+        reward, over = sim.step([a])
+        s2 = sim.getGameStates()[0]
+        transitions.append((s1, a, reward[0], s2, bool(over[0])))
+        s1 = s2
+        if over[0]:
+            sim.reset()
+            s1 = sim.getGameStates()[0]
+
+    def stepAgent(agent):
+        observe = agent.observe
+        policy = agent.policy
+        for s1, a, r, s2, end in transitions:
+            observe(s1, a, r, s2, end)
+            policy(s2)
+
+    def stepFeaturized(agent):
+        featurize = agent.featurize
+        observeFeatures = agent.observeFeatures
+        policyFeatures = agent.policyFeatures
+        f1 = featurize(transitions[0][0])
+        for s1, a, r, s2, end in transitions:
+            f2 = featurize(s2)
+            observeFeatures(f1, a, r, None if end else f2, end)
+            policyFeatures(f2)
+            f1 = f2
+
+    runs = [('dict', _DictQLearningAgent, stepAgent),
+            ('dense', QLearingAgent, stepAgent),
+            ('hashed', QLearingAgentHashed, stepAgent),
+            ('dense featurized', QLearingAgent, stepFeaturized),
+            ('hashed featurized', QLearingAgentHashed, stepFeaturized)]
+    for name, make, step in runs:
+        learner = make()
+        first = timeit.timeit(lambda: step(learner), number=1)
+        warm = min(timeit.repeat(lambda: step(learner), number=1, repeat=3))
+        print("%s: %.0f ns per frame (first pass), %.0f ns per frame (warm)"
+              % (name, first / nb_steps * 1e9, warm / nb_steps * 1e9))
+
+
+if __name__ == '__main__':
+    benchmark()
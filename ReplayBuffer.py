@@ -0,0 +1,98 @@
+import numpy as np
+
+
+class ReplayBuffer:
+    """ Fixed capacity ring buffer of transitions of a tabular agent, stored as
+        (state index, action, reward, next state index, end) in numpy arrays.
+        The state indices are DenseQTable indices (q.index(state), without the
+        action), the next state index of a terminal transition is not used.
+        Once the buffer is full the oldest transitions get overwritten.
+    """
+
+    def __init__(self, capacity, rng=None):
+        self.capacity = capacity
+        if isinstance(rng, np.random.RandomState):
+            self.rng = rng
+        else:
+            self.rng = np.random.RandomState(rng)
+
+        self.s1 = np.zeros(capacity, dtype=np.int64)
+        self.a = np.zeros(capacity, dtype=np.int64)
+        self.r = np.zeros(capacity)
+        self.s2 = np.zeros(capacity, dtype=np.int64)
+        self.end = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.position = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, s1, a, r, s2, end):
+        i = self.position
+        self.s1[i] = s1
+        self.a[i] = a
+        self.r[i] = r
+        self.s2[i] = s2
+        self.end[i] = end
+        self.position = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def sample(self, batchSize):
+        """ returns batchSize transitions drawn uniformly (with replacement) as
+            the arrays (s1, a, r, s2, end)
+        """
+        i = self.rng.randint(0, self.size, size=batchSize)
+        return self.s1[i], self.a[i], self.r[i], self.s2[i], self.end[i]
+
+    def snapshot(self):
+        """ (header, arrays) with everything restore needs (the stored
+            transitions, the position of the ring and the state of rng), see
+            Checkpoint
+        """
+        state = self.rng.get_state()
+        header = {'capacity': self.capacity, 'size': self.size, 'position': self.position,
+                  'rng': [state[0]] + list(state[2:])}
+        n = self.size
+        arrays = [('replayS1', np.array(self.s1[:n], dtype='<i8')), ('replayA', np.array(self.a[:n], dtype='<i8')),
+                  ('replayR', np.array(self.r[:n], dtype='<f8')), ('replayS2', np.array(self.s2[:n], dtype='<i8')),
+                  ('replayEnd', np.array(self.end[:n], dtype=np.uint8)),
+                  ('replayRngKey', np.array(state[1], dtype='<u4'))]
+        return header, arrays
+
+    @staticmethod
+    def fromSnapshot(header, arrays):
+        """ the buffer of a snapshot, arrays maps the names to the arrays """
+        state = header['rng']
+        rng = np.random.RandomState()
+        rng.set_state((str(state[0]), np.array(arrays['replayRngKey'])) + tuple(state[1:]))
+        replay = ReplayBuffer(header['capacity'], rng)
+        n = header['size']
+        replay.s1[:n] = arrays['replayS1']
+        replay.a[:n] = arrays['replayA']
+        replay.r[:n] = arrays['replayR']
+        replay.s2[:n] = arrays['replayS2']
+        replay.end[:n] = arrays['replayEnd']
+        replay.size = n
+        replay.position = header['position']
+        return replay
+
+
+def qLearningUpdate(q, batch, alpha, gamma):
+    """ applies the q-learning update of a batch of transitions (see
+        ReplayBuffer.sample) to the DenseQTable q at once. All targets are
+        computed from the q-values before the update. Transitions that update
+        the same q-value are combined by averaging their TD errors, so a
+        duplicate counts like a single update with the mean error (adding all of
+        them could overshoot once alpha times their number exceeds 1).
+    """
+    s1, a, r, s2, end = batch
+    values = q.values
+    maxNextQ = np.maximum(values[s2], values[s2 + 1])
+    maxNextQ[end] = 0.0
+    i1 = s1 + a
+    delta = r + gamma * maxNextQ - values[i1]
+
+    indices, inverse = np.unique(i1, return_inverse=True)
+    meanDelta = np.bincount(inverse, weights=delta) / np.bincount(inverse)
+    q.writeMany(indices, values[indices] + alpha * meanDelta)
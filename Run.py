@@ -2,9 +2,23 @@ from ple import PLE
 from ple.games.flappybird import FlappyBird
 import matplotlib.pyplot as plt
 import numpy as np
+import argparse
+import os
 
+import Checkpoint
+import Evaluation
+import FrozenPolicy
+import LeastSquares
+import TransitionLog
+from FlappyBirdSim import VectorFlappyBird
+from Profiler import PhaseProfiler
+from QTable import HashedQTable
+from ScoreStats import ScoreStats
 from LinearFunctionApproximation import LFA
 from QLearningAgent import QLearingAgent
+from QLearningAgentHashed import QLearingAgentHashed
+from QLambdaAgent import QLambdaAgent, SarsaLambdaAgent
+from DynaQAgent import DynaQAgent
 from QLearningAgentOptimizedReward import QLearingAgentOptimizedReward
 from QLearningAgentOptimizedGamma import QLearingAgentOptimizedGamma
 from QLearningAgentDynamicAlpha import QLearingAgentDynamicAlpha
@@ -27,19 +41,17 @@ agent = LFA()
 printEveryIterations = 100
 plotEveryNAverages = 20
 ################################
-_scores = []
+# the scores of all training episodes
+_scores = ScoreStats()
 
-def plotAverage():
-    addedScores = 0;
-    averageScores = []
-    splitEveryN = len(_scores) / plotEveryNAverages
-    for idx, score in enumerate(_scores):
-        addedScores += score
-        if (idx + 1) % splitEveryN == 0:
-            averageScores.append(addedScores / splitEveryN)
-            addedScores = 0
+# the agents a checkpoint can be resumed with, by class name
+agentClasses = dict((cls.__name__, cls) for cls in (
+    LFA, QLearingAgent, QLearingAgentOptimizedReward, QLearingAgentOptimizedGamma, QLearingAgentDynamicAlpha,
+    MCAgent, MCAgentDynamicAlpha, AgentBest, QLearingAgentTest, QLearingAgentHashed, QLambdaAgent,
+    SarsaLambdaAgent, DynaQAgent))
 
-    countEpisodes = range(splitEveryN, (len(averageScores) + 1) * splitEveryN, splitEveryN)
+def plotAverage():
+    countEpisodes, averageScores = _scores.blockAverages(plotEveryNAverages)
 
     plt.plot(countEpisodes, averageScores, 'o-', linewidth=2, label='Average training scores')
     plt.legend(loc='best')
@@ -47,105 +59,396 @@ def plotAverage():
     plt.ylabel("Average score")
     plt.show()
 
-def train_game(nb_episodes, agent):
+def train_game(nb_episodes, agent, rng=None, checkpoint=None, resume=None, actionRepeat=1,
+               profile=False, profileFile=None, log=None, scores=None):
     """ Runs nb_episodes episodes of the game with agent picking the moves.
         An episode of FlappyBird ends with the bird crashing into a pipe or going off screen.
+        rng seeds the game (the pipe gaps), None picks a random seed.
+
+        With actionRepeat k the agent decides every k frames only, its action
+        is repeated until the next decision (or the end of the game). The
+        agent observes one transition per decision whose reward is the
+        discounted sum of the rewards of its frames, agent.actionRepeat is set
+        to k so it discounts with gamma ** k per decision.
+
+        checkpoint is an optional Checkpoint.PeriodicCheckpointer that is told
+        about every finished episode, it also gets a final checkpoint at the end.
+        resume is the (header, arrays) of the checkpoint the agent and _scores
+        have been loaded from (see resume_training), the random numbers and
+        the velocity the bird carries into the next game then continue
+        exactly where that checkpoint was taken.
+
+        With profile the time spent in each phase of the loop is printed every
+        printEveryIterations episodes (see Profiler.PhaseProfiler), with
+        profileFile a cProfile of the whole run is written to that file.
+
+        log is an optional TransitionLog.TransitionLogWriter that records
+        every observed transition, to train other agents on them later
+        without running the game (see TransitionLog.train), its actionRepeat
+        is set to actionRepeat.
+
+        The score of every episode is appended to scores (a ScoreStats or a
+        list, _scores by default). Agents that train at the same time in one
+        process need their own.
     """
+    if scores is None:
+        scores = _scores
     reward_values = agent.reward_values()
+    agent.actionRepeat = actionRepeat
     game = FlappyBird()
     game.allowed_fps = None
-    env = PLE(game, fps=30, display_screen=False, force_fps=True, rng=None, reward_values=reward_values)
+    env = PLE(game, fps=30, display_screen=False, force_fps=True, rng=rng, reward_values=reward_values)
 
     env.init()
+    if resume is not None:
+        Checkpoint.restoreRandom(resume[0], resume[1], {'game': game.rng})
+        env.reset_game()
+        # PLE keeps the velocity of the bird from one game to the next
+        if 'playerVel' in resume[0]['extra']:
+            game.player.vel = resume[0]['extra']['playerVel']
 
     score = 0
     maxScore = 0
     numberOfFrames = 0
     realScore = 0
 
+    # the phases of a frame, replaced by timed versions when profiling
+    actionSet = env.getActionSet()
+    act = env.act
+    getGameState = env.game.getGameState
+    featurize = agent.featurize
+    trainingPolicy = agent.trainingPolicyFeatures
+    observe = agent.observeFeatures
+    reset = env.reset_game
+    episodeDone = checkpoint.episodeDone if checkpoint is not None else None
+    record = None
+    if log is not None:
+        # the rewards of the log are per decision, sums over actionRepeat frames
+        log.setActionRepeat(actionRepeat)
+        record = log.add
+    profiler = None
+    if profile or profileFile is not None:
+        profiler = PhaseProfiler(profileFile)
+        act = profiler.wrap('act', act)
+        getGameState = profiler.wrap('getGameState', getGameState)
+        featurize = profiler.wrap('featurize', featurize)
+        trainingPolicy = profiler.wrap('training_policy', trainingPolicy)
+        observe = profiler.wrap('observe', observe, endName='observe (episode end)')
+        reset = profiler.wrap('reset', reset)
+        if episodeDone is not None:
+            episodeDone = profiler.wrap('checkpoint', episodeDone)
+        if record is not None:
+            record = profiler.wrap('record', record, endName='record (episode end)')
+
+    # every state is fetched and featurized once, its features are used for
+    # the action and for the transitions into and out of it
+    s1 = getGameState()
+    f1 = featurize(s1)
     while nb_episodes > 0:
         # pick an action
-        s1 = env.game.getGameState()
-        action = agent.training_policy(s1)
+        action = trainingPolicy(f1)
         # print("reward=%s" % s1)
         # step the environment
-        reward = env.act(env.getActionSet()[action])
+        reward = 0
+        discount = 1
+        for frame in range(actionRepeat):
+            frameReward = act(actionSet[action])
+            reward += discount * frameReward
+            discount *= agent.gamma
+            score += frameReward
+            numberOfFrames += 1
+
+            if score > 99 and score <102:
+                realScore += 1
+            if env.game_over():
+                break
         # print("reward=%d" % reward)
-        s2 = env.game.getGameState()
         isGameOver = env.game_over()
+        s2 = None if isGameOver else getGameState()
+        f2 = None if isGameOver else featurize(s2)
         # for training let the agent observe the current state transition
-        agent.observe(s1, action, reward, s2, isGameOver)
-
-        score += reward
-        numberOfFrames += 1
-
-        if score > 99 and score <102:
-            realScore += 1
+        observe(f1, action, reward, f2, isGameOver)
+        if record is not None:
+            record(s1, action, reward, s2, isGameOver)
 
         # reset the environment if the game is over
         if isGameOver:
-            _scores.append(score)
+            scores.append(score)
 
             if nb_episodes % printEveryIterations == 0:
 #                print("score for this episode: %d" % realScore)
                 print("score for this episode: %d" % score)
                 print("number of frame %d" % numberOfFrames)
                 print("number of episodes left %d" % nb_episodes)
-            env.reset_game()
+                if profiler is not None:
+                    profiler.report(numberOfFrames)
+            # before the reset, which draws the pipes of the next episode
+            if episodeDone is not None:
+                episodeDone(agent, scores, {'episodesLeft': nb_episodes - 1, 'playerVel': game.player.vel},
+                            {'game': game.rng})
+            reset()
             nb_episodes -= 1
             realScore = 0
             if(score > maxScore):
                 maxScore = score
             score = 0
+            s2 = getGameState()
+            f2 = featurize(s2)
+        s1 = s2
+        f1 = f2
+    if checkpoint is not None:
+        checkpoint.checkpoint(agent, scores, {'episodesLeft': 0, 'playerVel': game.player.vel}, {'game': game.rng})
+    if profiler is not None:
+        profiler.report(numberOfFrames)
+        profiler.close()
+    print("best score: %d" % maxScore)
+
+def _restoreScores(header, arrays):
+    """ _scores from a checkpoint, older ones have the score of every episode """
+    _scores.clear()
+    if 'scores' in header:
+        _scores.restore(header['scores'], arrays)
+    elif 'scores' in arrays:
+        _scores.extend(arrays['scores'])
+
+def resume_training(path, everyEpisodes=1000, everySeconds=None):
+    """ loads the training session checkpointed in path (agent, its learning
+        rate schedule, its actionRepeat, _scores and the random states),
+        trains the episodes that were left and returns the agent
+    """
+    header, arrays = Checkpoint.openCheckpoint(path)
+    agent = agentClasses[header['agent']]()
+    Checkpoint.load(agent, path)
+    _restoreScores(header, arrays)
+    nb_episodes = header['extra']['episodesLeft']
+    print("resuming %s with %d episodes left" % (header['agent'], nb_episodes))
+
+    checkpoint = Checkpoint.PeriodicCheckpointer(path, everyEpisodes, everySeconds)
+    try:
+        if nb_episodes > 0:
+            train_game(nb_episodes, agent, checkpoint=checkpoint, resume=(header, arrays),
+                       actionRepeat=agent.actionRepeat)
+        else:
+            Checkpoint.restoreRandom(header, arrays)
+    finally:
+        checkpoint.close()
+    return agent
+
+def train_game_vectorized(nb_episodes, agent, nb_envs=64, rng=None, actionRepeat=1, scores=None, printEvery=None):
+    """ Runs nb_episodes episodes like train_game, but on the numpy simulator
+        (FlappyBirdSim) with nb_envs games played in lockstep (actionRepeat
+        as in train_game).
+        The transitions of the games reach agent.observeFeatures interleaved, so this
+        only works for agents that do not rely on two subsequent calls being
+        from the same episode (not for MCAgent, MCAgentDynamicAlpha,
+        QLambdaAgent and SarsaLambdaAgent, see orderedEpisodes), these raise a
+        ValueError unless nb_envs is 1. scores is as in train_game.
+        The progress is printed every printEvery episodes (printEveryIterations
+        by default), never when printEvery is 0.
+    """
+    if printEvery is None:
+        printEvery = printEveryIterations
+    if nb_envs > 1 and getattr(agent, 'orderedEpisodes', False):
+        raise ValueError("%s needs the transitions of an episode in order, use nb_envs=1"
+                         % agent.__class__.__name__)
+    if scores is None:
+        scores = _scores
+    sim = VectorFlappyBird(nb_envs, reward_values=agent.reward_values(), rng=rng)
+    agent.actionRepeat = actionRepeat
+
+    episodeScores = np.zeros(nb_envs)
+    maxScore = 0
+    numberOfFrames = 0
+
+    # the states are featurized once, as in train_game
+    featurize = agent.featurize
+    features = [featurize(s) for s in sim.getGameStates()]
+    while nb_episodes > 0:
+        actions = [agent.trainingPolicyFeatures(f) for f in features]
+        # games that end during the repeat are frozen with a reward of 0
+        rewards = np.zeros(nb_envs)
+        discount = 1
+        for frame in range(actionRepeat):
+            frameRewards, isGameOver = sim.step(actions)
+            rewards += discount * frameRewards
+            discount *= agent.gamma
+            episodeScores += frameRewards
+            numberOfFrames += nb_envs
+            if isGameOver.all():
+                break
+        ends = isGameOver.tolist()
+        nextFeatures = [None if end else featurize(s) for s, end in zip(sim.getGameStates(), ends)]
+        for i, reward in enumerate(rewards.tolist()):
+            agent.observeFeatures(features[i], actions[i], reward, nextFeatures[i], ends[i])
+
+        if isGameOver.any():
+            for score in episodeScores[isGameOver].tolist():
+                scores.append(score)
+                if printEvery and nb_episodes % printEvery == 0:
+                    print("score for this episode: %d" % score)
+                    print("number of frame %d" % numberOfFrames)
+                    print("number of episodes left %d" % nb_episodes)
+                nb_episodes -= 1
+                if(score > maxScore):
+                    maxScore = score
+                if nb_episodes == 0:
+                    break
+            episodeScores[isGameOver] = 0
+            sim.reset(isGameOver)
+            states = sim.getGameStates()
+            for i in np.flatnonzero(isGameOver).tolist():
+                nextFeatures[i] = featurize(states[i])
+        features = nextFeatures
     print("best score: %d" % maxScore)
 
-def run_game(nb_episodes, agent):
+def run_game(nb_episodes, agent, actionRepeat=None, profile=False, profileFile=None):
     """ Runs nb_episodes episodes of the game with agent picking the moves.
         An episode of FlappyBird ends with the bird crashing into a pipe or going off screen.
+        Every action is repeated for actionRepeat frames, by default as many
+        as the agent was trained with (see train_game).
+        profile and profileFile are as in train_game, the time per phase is
+        printed after every printEveryIterations episodes.
     """
+    if actionRepeat is None:
+        actionRepeat = getattr(agent, 'actionRepeat', 1)
 
     reward_values = {"positive": 1.0, "negative": 0.0, "tick": 0.0, "loss": 0.0, "win": 0.0}
 
     env = PLE(FlappyBird(), fps=30, display_screen=True, force_fps=False, rng=None,
               reward_values=reward_values)
     env.init()
+
+    # the phases of a frame, replaced by timed versions when profiling
+    actionSet = env.getActionSet()
+    act = env.act
+    getGameState = env.game.getGameState
+    policy = agent.policy
+    reset = env.reset_game
+    profiler = None
+    if profile or profileFile is not None:
+        profiler = PhaseProfiler(profileFile)
+        act = profiler.wrap('act', act)
+        getGameState = profiler.wrap('getGameState', getGameState)
+        policy = profiler.wrap('policy', policy)
+        reset = profiler.wrap('reset', reset)
+
     score = 0
+    numberOfFrames = 0
+    episodes = 0
     while nb_episodes > 0:
         # pick an action
-        action = agent.policy(env.game.getGameState())
+        action = policy(getGameState())
 
         # step the environment
-        reward = env.act(env.getActionSet()[action])
-        score += reward
+        for frame in range(actionRepeat):
+            reward = act(actionSet[action])
+            score += reward
+            numberOfFrames += 1
+            if env.game_over():
+                break
         # reset the environment if the game is over
         if env.game_over():
             print("score for this episode: %d" % score)
-            env.reset_game()
+            reset()
             nb_episodes -= 1
+            episodes += 1
             score = 0
+            if profiler is not None and episodes % printEveryIterations == 0:
+                profiler.report(numberOfFrames)
+    if profiler is not None:
+        profiler.report(numberOfFrames)
+        profiler.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', help="file to checkpoint the training sessions to")
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help="episodes between checkpoints")
+    parser.add_argument('--checkpoint-seconds', type=float, help="seconds between checkpoints")
+    parser.add_argument('--resume', help="checkpoint of the training session to continue")
+    parser.add_argument('--profile', action='store_true', help="print the time spent in each phase of the loop")
+    parser.add_argument('--profile-file', help="file to write a cProfile of training and running to")
+    parser.add_argument('--record', help="directory to record the transitions of the training sessions to")
+    args = parser.parse_args()
+    if args.resume:
+        agent = resume_training(args.resume, args.checkpoint_every, args.checkpoint_seconds)
+        if args.checkpoint is None:
+            args.checkpoint = args.resume
 
-print "current agent : %s" % agent.__class__
-while(True):
-    choice = int(raw_input("1: Training \n2: Save Q \n3: Load Q \n4: Run "
-                           "\n5: Plot Pi \n6: Plot Average \n0: Exit \n\nType in: "))
-    if choice == 0:
-        break
-    if choice == 1:
-        rounds = int(raw_input("Enter Trainrounds: "))
-        train_game(rounds, agent)
-    if choice == 2:
-        name = raw_input("Enter Filename: ")
-        np.save(name + 'Q.npy', dict(agent._q))
-        np.save(name + 'S.npy', _scores)
-    if choice == 3:
-        name = raw_input("Enter Filename: ")
-        # Load
-        agent._q = np.load(name + 'Q.npy').item()
-        _scores = np.load(name + 'S.npy').tolist()
-    if choice == 4:
-        rounds = int(raw_input("Enter Runrounds: "))
-        run_game(rounds, agent)
-    if choice == 5:
-        agent.plotQ('pi')
-    if choice == 6:
-        plotAverage()
\ No newline at end of file
+    print "current agent : %s" % agent.__class__
+    while(True):
+        choice = int(raw_input("1: Training \n2: Save Q \n3: Load Q \n4: Run "
+                               "\n5: Plot Pi \n6: Plot Average \n7: Training (numpy simulator) "
+                               "\n8: Score statistics (and q-table usage) \n9: Save frozen policy "
+                               "\n10: Run frozen policy \n11: Training (transition log) "
+                               "\n12: Training (least squares, transition log) "
+                               "\n13: Evaluate (headless, official scoring) "
+                               "\n0: Exit \n\nType in: "))
+        if choice == 0:
+            break
+        if choice == 1:
+            rounds = int(raw_input("Enter Trainrounds: "))
+            checkpoint = None
+            if args.checkpoint:
+                checkpoint = Checkpoint.PeriodicCheckpointer(args.checkpoint, args.checkpoint_every,
+                                                             args.checkpoint_seconds)
+            log = None
+            if args.record:
+                log = TransitionLog.TransitionLogWriter(args.record, agent.reward_values())
+            try:
+                train_game(rounds, agent, checkpoint=checkpoint, profile=args.profile,
+                           profileFile=args.profile_file, log=log)
+            finally:
+                if checkpoint is not None:
+                    checkpoint.close()
+                if log is not None:
+                    log.close()
+        if choice == 2:
+            name = raw_input("Enter Filename: ")
+            Checkpoint.save(agent, name + '.ckpt', scores=_scores)
+        if choice == 3:
+            name = raw_input("Enter Filename: ")
+            # Load
+            if os.path.exists(name + '.ckpt'):
+                header, arrays = Checkpoint.load(agent, name + '.ckpt')
+                _restoreScores(header, arrays)
+            else:
+                # files saved before the checkpoint format
+                agent._q.clear()
+                agent._q.update(np.load(name + 'Q.npy').item())
+                _scores.clear()
+                _scores.extend(np.load(name + 'S.npy'))
+        if choice == 4:
+            rounds = int(raw_input("Enter Runrounds: "))
+            run_game(rounds, agent, profile=args.profile, profileFile=args.profile_file)
+        if choice == 5:
+            agent.plotQ('pi')
+        if choice == 6:
+            plotAverage()
+        if choice == 7:
+            rounds = int(raw_input("Enter Trainrounds: "))
+            train_game_vectorized(rounds, agent, nb_envs=1 if getattr(agent, 'orderedEpisodes', False) else 64)
+        if choice == 8:
+            for name, value in sorted(_scores.summary().items()):
+                print("%s: %g" % (name, value))
+            if isinstance(getattr(agent, '_q', None), HashedQTable):
+                for name, value in sorted(agent._q.stats().items()):
+                    print("q-table %s: %s" % (name, value))
+        if choice == 9:
+            name = raw_input("Enter Filename: ")
+            FrozenPolicy.freeze(agent).save(name + '.policy')
+        if choice == 10:
+            name = raw_input("Enter Filename: ")
+            rounds = int(raw_input("Enter Runrounds: "))
+            run_game(rounds, FrozenPolicy.load(name + '.policy'), profile=args.profile,
+                     profileFile=args.profile_file)
+        if choice == 11:
+            name = raw_input("Enter Directory: ")
+            passes = int(raw_input("Enter Passes: "))
+            print("observed %d transitions" % TransitionLog.train(name, agent, passes))
+        if choice == 12:
+            name = raw_input("Enter Directory: ")
+            iterations = int(raw_input("Enter Iterations: "))
+            print("solved from %d transitions" % len(LeastSquares.train(name, agent, iterations)))
+        if choice == 13:
+            rounds = int(raw_input("Enter Runrounds: "))
+            Evaluation.report(Evaluation.summarize(Evaluation.evaluate(agent, range(rounds))))
@@ -0,0 +1,238 @@
+import collections
+import math
+
+import numpy as np
+
+
+class ScoreStats:
+    """ Statistics of the scores of the training episodes in bounded memory,
+        updated in O(1) per episode:
+
+        - count, mean, standard deviation and max of all episodes
+        - mean, max and percentiles of the last w episodes for each w in windows
+        - exponentially decayed averages for each decay in decays (bias
+          corrected, like the mean of the last ~1 / (1 - decay) episodes)
+        - the sums of at most maxBlocks blocks of consecutive episodes, for
+          blockAverages: a block is one episode until maxBlocks blocks are
+          full, then neighbouring blocks are merged and every block holds
+          twice as many episodes as before
+
+        Only the last max(windows) scores are kept (see recent), the memory
+        does not grow with the number of episodes. Code that needs the score
+        of every episode keeps a list of its own (see ParallelRuns).
+    """
+
+    def __init__(self, windows=(100, 1000), decays=(0.99, 0.999), percentiles=(50, 90), maxBlocks=4096):
+        if maxBlocks < 2 or maxBlocks % 2:
+            raise ValueError("maxBlocks has to be even and at least 2, not %r" % maxBlocks)
+        self.windows = tuple(windows)
+        self.decays = tuple(decays)
+        self.percentiles = tuple(percentiles)
+        self.maxBlocks = maxBlocks
+        self.clear()
+
+    def clear(self):
+        # the last scores, score i at i % len(_recent)
+        self._recent = np.zeros(max(self.windows + (1,)))
+        self._count = 0
+        self.total = 0.0
+        self.totalSquares = 0.0
+        self.max = float('-inf')
+        self._blocks = np.zeros(self.maxBlocks)
+        self._nbBlocks = 0
+        self._blockSize = 1
+        # sum of the episodes after the last complete block
+        self._blockSum = 0.0
+        self._windowSums = dict((w, 0.0) for w in self.windows)
+        # candidates for the maximum of each window: decreasing scores with
+        # their episode numbers
+        self._windowMax = dict((w, collections.deque()) for w in self.windows)
+        # how often each score occurs in each window, for the percentiles
+        self._windowCounts = dict((w, collections.Counter()) for w in self.windows)
+        self._decayed = dict((d, 0.0) for d in self.decays)
+
+    def append(self, score):
+        score = float(score)
+        i = self._count
+        recent = self._recent
+        size = len(recent)
+        self.total += score
+        self.totalSquares += score * score
+        if score > self.max:
+            self.max = score
+
+        for w in self.windows:
+            counts = self._windowCounts[w]
+            counts[score] += 1
+            self._windowSums[w] += score
+            candidates = self._windowMax[w]
+            while candidates and candidates[-1][0] <= score:
+                candidates.pop()
+            candidates.append((score, i))
+            if i >= w:
+                old = float(recent[(i - w) % size])
+                self._windowSums[w] -= old
+                counts[old] -= 1
+                if not counts[old]:
+                    del counts[old]
+                if candidates[0][1] <= i - w:
+                    candidates.popleft()
+        recent[i % size] = score
+        self._count = i + 1
+
+        self._blockSum += score
+        if self._count == (self._nbBlocks + 1) * self._blockSize:
+            blocks = self._blocks
+            blocks[self._nbBlocks] = self._blockSum
+            self._nbBlocks += 1
+            self._blockSum = 0.0
+            if self._nbBlocks == self.maxBlocks:
+                half = self.maxBlocks // 2
+                blocks[:half] = blocks[0::2] + blocks[1::2]
+                blocks[half:] = 0
+                self._nbBlocks = half
+                self._blockSize *= 2
+
+        for d in self.decays:
+            self._decayed[d] = d * self._decayed[d] + (1 - d) * score
+
+    def extend(self, scores):
+        for score in scores:
+            self.append(score)
+
+    def __len__(self):
+        return self._count
+
+    def recent(self):
+        """ the last max(windows) scores (fewer at the start), oldest first """
+        n = self._count
+        if n <= len(self._recent):
+            return self._recent[:n].copy()
+        return np.roll(self._recent, -(n % len(self._recent)))
+
+    def mean(self, window=None):
+        """ the mean of all scores or of the last window scores (window has to
+            be one of windows)
+        """
+        n = self._count
+        if not n:
+            return float('nan')
+        if window is None:
+            return self.total / n
+        return self._windowSums[window] / min(n, window)
+
+    def std(self):
+        """ the standard deviation of all scores """
+        n = self._count
+        if not n:
+            return float('nan')
+        mean = self.total / n
+        return math.sqrt(max(0.0, self.totalSquares / n - mean * mean))
+
+    def windowMax(self, window):
+        candidates = self._windowMax[window]
+        return candidates[0][0] if candidates else float('nan')
+
+    def percentile(self, q, window):
+        """ the q-th percentile (nearest rank) of the last window scores """
+        counts = self._windowCounts[window]
+        n = min(self._count, window)
+        if not n:
+            return float('nan')
+        rank = int(math.ceil(q / 100.0 * n)) or 1
+        seen = 0
+        for score in sorted(counts):
+            seen += counts[score]
+            if seen >= rank:
+                return score
+
+    def decayedMean(self, decay):
+        n = self._count
+        if not n:
+            return float('nan')
+        return self._decayed[decay] / (1 - decay ** n)
+
+    def summary(self):
+        """ all statistics as a dict """
+        stats = {'episodes': len(self), 'mean': self.mean(), 'std': self.std(), 'max': self.max}
+        for w in self.windows:
+            stats['mean_%d' % w] = self.mean(w)
+            stats['max_%d' % w] = self.windowMax(w)
+            for q in self.percentiles:
+                stats['p%d_%d' % (q, w)] = self.percentile(q, w)
+        for d in self.decays:
+            stats['decayed_%g' % d] = self.decayedMean(d)
+        return stats
+
+    def blockAverages(self, nbBlocks):
+        """ splits the scores into blocks of len // nbBlocks episodes (at least
+            one), the remaining episodes form a last shorter block. Returns
+            (last episode of each block, average of each block).
+
+            The blocks are made of the stored ones, so once these hold more
+            than one episode the length of a block is rounded down to a
+            multiple of theirs (but is at least one of them).
+        """
+        n = self._count
+        if not n:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        blockSize = self._blockSize
+        perBlock = max(1, n // nbBlocks // blockSize)
+        m = self._nbBlocks
+        starts = np.arange(0, m, perBlock)
+        sums = np.add.reduceat(self._blocks[:m], starts) if m else np.zeros(0)
+        lengths = np.diff(np.append(starts, m)) * blockSize
+        rest = n - m * blockSize
+        if rest:
+            if len(lengths) and lengths[-1] < perBlock * blockSize:
+                sums[-1] += self._blockSum
+                lengths[-1] += rest
+            else:
+                sums = np.append(sums, self._blockSum)
+                lengths = np.append(lengths, rest)
+        return np.cumsum(lengths), sums / lengths
+
+    def snapshot(self):
+        """ (header, arrays) with everything restore needs, see Checkpoint """
+        header = {'windows': self.windows, 'decays': self.decays, 'maxBlocks': self.maxBlocks,
+                  'count': self._count, 'total': self.total, 'totalSquares': self.totalSquares,
+                  'max': self.max, 'nbBlocks': self._nbBlocks, 'blockSize': self._blockSize,
+                  'blockSum': self._blockSum, 'windowSums': [self._windowSums[w] for w in self.windows],
+                  'decayed': [self._decayed[d] for d in self.decays]}
+        arrays = [('scoreRecent', np.array(self._recent, dtype='<f8')),
+                  ('scoreBlocks', np.array(self._blocks[:self._nbBlocks], dtype='<f8'))]
+        return header, arrays
+
+    def restore(self, header, arrays):
+        """ loads a snapshot of statistics with the same windows, decays and
+            maxBlocks
+        """
+        if (tuple(header['windows']) != self.windows or tuple(header['decays']) != self.decays
+                or header['maxBlocks'] != self.maxBlocks):
+            raise ValueError("scores kept with windows %s, decays %s and %d blocks do not fit windows %s, "
+                             "decays %s and %d blocks" % (tuple(header['windows']), tuple(header['decays']),
+                                                          header['maxBlocks'], self.windows, self.decays,
+                                                          self.maxBlocks))
+        self.clear()
+        self._recent[:] = arrays['scoreRecent']
+        n = self._count = header['count']
+        self.total = header['total']
+        self.totalSquares = header['totalSquares']
+        self.max = header['max']
+        self._nbBlocks = header['nbBlocks']
+        self._blocks[:self._nbBlocks] = arrays['scoreBlocks']
+        self._blockSize = header['blockSize']
+        self._blockSum = header['blockSum']
+        self._windowSums = dict(zip(self.windows, header['windowSums']))
+        self._decayed = dict(zip(self.decays, header['decayed']))
+        # the maxima and counts of the windows follow from their scores
+        size = len(self._recent)
+        for w in self.windows:
+            counts = self._windowCounts[w]
+            candidates = self._windowMax[w]
+            for i in range(max(0, n - w), n):
+                score = float(self._recent[i % size])
+                counts[score] += 1
+                while candidates and candidates[-1][0] <= score:
+                    candidates.pop()
+                candidates.append((score, i))
@@ -0,0 +1,182 @@
+import itertools
+import multiprocessing
+import random
+
+import numpy as np
+import pandas as pd
+
+from Discretizer import Discretizer
+from FlappyBirdSim import STATE_RANGES, VectorFlappyBird
+from QTable import DenseQTable, HashedQTable
+from ReplayBuffer import ReplayBuffer
+
+
+def evaluate(agent, nb_episodes=20, rng=None, maxFrames=10000, actionRepeat=None):
+    """ plays nb_episodes games in the simulator with agent.policy and returns
+        the official scores (1 for each pipe passed). Games still running after
+        maxFrames frames are stopped. actionRepeat is as in Run.run_game.
+    """
+    if actionRepeat is None:
+        actionRepeat = getattr(agent, 'actionRepeat', 1)
+    sim = VectorFlappyBird(nb_episodes, reward_values={"positive": 1.0, "tick": 0.0, "loss": 0.0}, rng=rng)
+    for frame in range(maxFrames):
+        running = (~sim.over).tolist()
+        if not any(running):
+            break
+        if frame % actionRepeat == 0:
+            actions = [agent.policy(s) if r else 1 for s, r in zip(sim.getGameStates(), running)]
+        sim.step(actions)
+    return sim.score.copy()
+
+
+def configure(agent, config):
+    """ applies a configuration to an agent. config maps attribute names
+        ('alpha', 'gamma', 'epsilon', ...) to values, plus optionally
+        'reward_values' (the dict reward_values() should return) and
+        'discretization' (a (stateSpec, stateBounds) pair for the tabular
+        agents, which gives the agent its own empty q-table).
+    """
+    for name, value in config.items():
+        if name == 'reward_values':
+            agent.reward_values = lambda rewards=dict(value): dict(rewards)
+        elif name == 'discretization':
+            stateSpec, stateBounds = value
+            agent.stateSpec = stateSpec
+            agent.stateBounds = stateBounds
+            agent._discretizer = Discretizer(stateSpec)
+            agent._discretizer.checkBounds(stateBounds, STATE_RANGES)
+            agent._q = DenseQTable(stateBounds)
+            agent.discretizeState = agent._discretizer.discretize
+            agent.stateIndex = agent.featurize = agent._discretizer.indexer(agent._q)
+        else:
+            setattr(agent, name, value)
+    return agent
+
+
+def _getState(agent):
+    """ everything a run needs to continue training in another process """
+    state = {'agentRandom': agent._random.getState(), 'numpy': np.random.get_state()}
+    for name in ('alpha', 'gamma', 'epsilon', '_episodeCount', '_replayCount'):
+        if hasattr(agent, name):
+            state[name] = getattr(agent, name)
+    if getattr(agent, '_replay', None) is not None:
+        header, arrays = agent._replay.snapshot()
+        state['replay'] = (header, dict(arrays))
+    if hasattr(agent, 'snapshotModel'):
+        header, arrays = agent.snapshotModel()
+        state['model'] = (header, dict(arrays))
+    if hasattr(agent, '_thetaA0'):
+        state['theta'] = (list(agent._thetaA0), list(agent._thetaA1))
+    elif isinstance(agent._q, HashedQTable):
+        header, arrays = agent._q.snapshot()
+        state['hashed'] = (header, dict(arrays))
+    elif hasattr(agent._q, 'table'):
+        state['q'] = (agent._q.table.copy(), bytearray(agent._q.visited))
+    else:
+        state['q'] = dict((s, list(v)) for s, v in agent._q.items())
+    return state
+
+
+def _setState(agent, state):
+    agent._random.setState(state['agentRandom'])
+    np.random.set_state(state['numpy'])
+    for name in ('alpha', 'gamma', 'epsilon', '_episodeCount', '_replayCount'):
+        if name in state:
+            setattr(agent, name, state[name])
+    if 'replay' in state:
+        agent._replay = ReplayBuffer.fromSnapshot(*state['replay'])
+    if 'model' in state:
+        agent.restoreModel(*state['model'])
+    if 'theta' in state:
+        agent._thetaA0 = list(state['theta'][0])
+        agent._thetaA1 = list(state['theta'][1])
+    elif 'hashed' in state:
+        agent._q.restore(*state['hashed'])
+    elif hasattr(agent._q, 'table'):
+        agent._q.table[...] = state['q'][0]
+        agent._q.visited[:] = state['q'][1]
+    else:
+        agent._q.clear()
+        agent._q.update(state['q'])
+
+
+def _trainRung(job):
+    agentClass, config, state, nb_episodes, seed, nb_envs, evalEpisodes, evalSeed = job
+    import Run
+
+    agent = configure(agentClass(seed), config)
+    if state is None:
+        np.random.seed(seed)
+    else:
+        _setState(agent, state)
+    Run._scores.clear()
+    Run.train_game_vectorized(nb_episodes, agent, nb_envs=nb_envs, rng=np.random.randint(2 ** 31), printEvery=0)
+    scores = evaluate(agent, evalEpisodes, rng=evalSeed)
+    return _getState(agent), float(scores.mean())
+
+
+def sampleConfigs(space, nb_configs=None, seed=0):
+    """ space maps a configuration key (see configure) to the list of values
+        to try. Returns the full grid, or nb_configs configurations drawn from
+        it without repetition.
+    """
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+    if nb_configs is None or nb_configs >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, nb_configs)
+
+
+def successive_halving(agentClass, space, nb_configs=None, budgets=(500, 1000, 2000, 4000),
+                       eta=2, seed=0, processes=None, nb_envs=64, evalEpisodes=20):
+    """ trains the configurations of space (see sampleConfigs) in parallel worker
+        processes. After each budget (number of training episodes, counted from
+        the start) every configuration is evaluated with the official scoring
+        on the same evaluation games and only the best 1/eta of them continue
+        training.
+        Agents that need their episodes in order (MC, Q(lambda)) need
+        nb_envs=1, see Run.train_game_vectorized.
+
+        Returns a table of the configurations ranked by their last score.
+    """
+    configs = sampleConfigs(space, nb_configs, seed)
+    rows = [dict(config, episodes=0) for config in configs]
+    states = [None] * len(configs)
+    alive = range(len(configs))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for rung, budget in enumerate(budgets):
+            jobs = [(agentClass, configs[i], states[i], budget - rows[i]['episodes'], seed + 1 + i, nb_envs,
+                     evalEpisodes, seed)
+                    for i in alive]
+            for i, (state, score) in zip(alive, pool.map(_trainRung, jobs, chunksize=1)):
+                states[i] = state
+                rows[i]['episodes'] = budget
+                rows[i]['score'] = score
+                rows[i]['score_%d' % budget] = score
+            print("after %d episodes: best score %.2f of %d configurations"
+                  % (budget, max(rows[i]['score'] for i in alive), len(alive)))
+            if rung < len(budgets) - 1:
+                alive = sorted(alive, key=lambda i: rows[i]['score'], reverse=True)[:max(1, len(alive) // eta)]
+    finally:
+        pool.close()
+        pool.join()
+
+    table = pd.DataFrame(rows)
+    table = table.sort_values(['episodes', 'score'], ascending=False).reset_index(drop=True)
+    table.index += 1
+    return table
+
+
+if __name__ == '__main__':
+    from QLearningAgent import QLearingAgent
+
+    space = {
+        'alpha': [0.1, 0.3, 0.5],
+        'gamma': [0.9, 1],
+        'epsilon': [0.0, 0.1],
+        'reward_values': [{"positive": 1.0, "tick": 0.0, "loss": -5.0},
+                          {"positive": 100.0, "tick": 1.0, "loss": -1000.0}],
+    }
+    print(successive_halving(QLearingAgent, space))
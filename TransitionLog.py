@@ -0,0 +1,210 @@
+import os
+
+import numpy as np
+
+import Checkpoint
+from FlappyBirdSim import STATE_KEYS
+from QTable import DenseQTable, HashedQTable
+
+# transitions per chunk file
+CHUNK_ROWS = 65536
+
+
+class TransitionLogWriter:
+    """ Records the transitions (s1, a, r, s2, end) that train_game observes
+        into path, a directory of chunks of chunkRows transitions each.
+
+        A chunk is a file in the checkpoint format (see Checkpoint) with one
+        column per key of the state and for the actions, rewards and end
+        flags. s2 is not stored, it is the s1 of the next transition (the s2
+        of the last transition of a chunk is stored separately), the states
+        at the end of an episode are not stored at all (observe gets no
+        features for them).
+
+        Every column is stored in the smallest of int8/int16/int32 and
+        float32 that holds its values exactly, otherwise as float64, and read
+        back as the python type the game returned, so the agents discretize
+        the recorded states exactly like the live ones.
+
+        rewardValues and actionRepeat are the ones of the agent that played,
+        see train. train_game sets actionRepeat to its own (see
+        setActionRepeat), every chunk records the one of its transitions.
+    """
+
+    def __init__(self, path, rewardValues, actionRepeat=1, chunkRows=CHUNK_ROWS, keys=STATE_KEYS):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.rewardValues = dict(rewardValues)
+        self.actionRepeat = actionRepeat
+        self.chunkRows = chunkRows
+        self.keys = tuple(keys)
+        self.chunks = len(_chunkFiles(path))
+        self.rows = 0
+        self._clear()
+
+    def _clear(self):
+        self._columns = dict((key, []) for key in self.keys)
+        self._actions = []
+        self._rewards = []
+        self._ends = []
+
+    def add(self, s1, a, r, s2, end):
+        columns = self._columns
+        for key in self.keys:
+            columns[key].append(s1[key])
+        self._actions.append(a)
+        self._rewards.append(r)
+        self._ends.append(end)
+        self._last = s2
+        if len(self._actions) == self.chunkRows:
+            self.flush()
+
+    def setActionRepeat(self, actionRepeat):
+        """ the actionRepeat of the transitions added from now on, the ones
+            added before are written with theirs first
+        """
+        if actionRepeat != self.actionRepeat:
+            self.flush()
+            self.actionRepeat = actionRepeat
+
+    def flush(self):
+        """ writes the transitions added since the last flush as a chunk """
+        if not self._actions:
+            return
+        header = {'version': Checkpoint.VERSION, 'agent': 'TransitionLog', 'rows': len(self._actions),
+                  'rewardValues': self.rewardValues, 'actionRepeat': self.actionRepeat, 'types': {}}
+        arrays = []
+        for key in self.keys:
+            kind, values = _compact(self._columns[key])
+            header['types'][key] = kind
+            arrays.append(('s_' + key, values))
+            if not self._ends[-1]:
+                arrays.append(('last_' + key, np.array([self._last[key]], dtype='<i8' if kind == 'int' else '<f8')))
+        rewards = _compact(self._rewards)[1]
+        arrays += [('actions', np.array(self._actions, dtype=np.int8)), ('rewards', rewards),
+                   ('ends', np.array(self._ends, dtype=np.uint8))]
+        Checkpoint.write(os.path.join(self.path, 'chunk%06d.log' % self.chunks), (header, arrays))
+        self.chunks += 1
+        self.rows += len(self._actions)
+        self._clear()
+
+    def close(self):
+        self.flush()
+
+
+def _compact(values):
+    """ (python type, smallest exact array) of a column """
+    isInt = all(isinstance(v, (int, long, np.integer)) for v in values)
+    array = np.array(values, dtype=np.int64 if isInt else np.float64)
+    for dtype in (np.int8, np.int16, np.int32):
+        if np.array_equal(array.astype(dtype), array):
+            return 'int' if isInt else 'float', array.astype(np.dtype(dtype).newbyteorder('<'))
+    if not isInt and np.array_equal(array.astype(np.float32), array):
+        return 'float', array.astype('<f4')
+    return 'int' if isInt else 'float', array.astype('<i8' if isInt else '<f8')
+
+
+def _chunkFiles(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.log'))
+
+
+def readChunks(path):
+    """ yields the chunks of the log in path as (header, states, actions,
+        rewards, ends, last): states maps every key to an array of the
+        recorded values (int64 or float64, like the game returned them),
+        last is the s2 of the last transition (None if it ended an episode).
+        The files are memory mapped, a chunk is only read when it is used.
+    """
+    for name in _chunkFiles(path):
+        header, arrays = Checkpoint.openCheckpoint(name)
+        types = header['types']
+        states = {}
+        last = None if arrays['ends'][-1] else {}
+        for key, kind in types.items():
+            dtype = np.int64 if kind == 'int' else np.float64
+            states[str(key)] = arrays['s_' + key].astype(dtype)
+            if last is not None:
+                last[str(key)] = arrays['last_' + key].astype(dtype).tolist()[0]
+        yield (header, states, arrays['actions'].astype(np.int64), arrays['rewards'].astype(np.float64),
+               arrays['ends'].astype(bool), last)
+
+
+def featurizeMany(agent, states):
+    """ agent.featurize of every state in states (a dict of arrays), as a
+        list. Vectorized with the agent's Discretizer for the tabular agents
+        (dense and hashed tables) and the one-hot LFA, one call of featurize
+        per state for the others.
+    """
+    discretizer = getattr(agent, '_discretizer', None)
+    q = getattr(agent, '_q', None)
+    if discretizer is not None and isinstance(q, DenseQTable):
+        d = discretizer.discretizeMany(states)
+        base = -sum(low * stride for (low, high), stride in zip(q.bounds, q.strides))
+        return (base + d.dot(np.array(q.strides, dtype=np.int64))).tolist()
+    if discretizer is not None and isinstance(q, HashedQTable):
+        d = discretizer.discretizeMany(states)
+        n = d.shape[1]
+        bits = 63 // n
+        keys = np.zeros(len(d), dtype=np.int64)
+        for k in range(n):
+            keys += (d[:, k] + (1 << (bits - 1))) << (bits * (n - 1 - k))
+        return keys.tolist()
+    if discretizer is not None and hasattr(agent, 'nbFeatures'):
+        d = discretizer.discretizeMany(states)
+        offsets = np.cumsum([0] + [len(edges) + 1 for name, expression, edges in discretizer.spec])[:-1]
+        return [tuple(row) for row in (d + offsets).tolist()]
+    keys = list(states)
+    columns = [states[key].tolist() for key in keys]
+    return [agent.featurize(dict(zip(keys, values))) for values in zip(*columns)]
+
+
+def rewardsFor(rewards, recorded, wanted, actionRepeat=1):
+    """ the rewards of the recorded transitions under the reward values
+        wanted instead of the recorded ones. Every reward is tick plus
+        positive per passed pipe plus loss if crashed, which determines the
+        events unless the recorded values are ambiguous. Only possible when
+        every transition is a single frame (actionRepeat 1), the discounted
+        sums of longer transitions raise a ValueError.
+    """
+    if wanted == recorded:
+        return rewards
+    if actionRepeat != 1:
+        raise ValueError("the rewards of a log with actionRepeat %d cannot be converted" % actionRepeat)
+    converted = np.full(len(rewards), np.nan)
+    matches = np.zeros(len(rewards), dtype=int)
+    for passed in (0, 1):
+        for crashed in (0, 1):
+            match = np.isclose(rewards, recorded["tick"] + recorded["positive"] * passed
+                               + recorded["loss"] * crashed)
+            converted[match] = wanted["tick"] + wanted["positive"] * passed + wanted["loss"] * crashed
+            matches += match
+    if (matches != 1).any():
+        raise ValueError("the recorded rewards cannot be converted from %s to %s" % (recorded, wanted))
+    return converted
+
+
+def train(path, agent, passes=1):
+    """ trains agent offline on the log in path: streams every recorded
+        transition through agent.observeFeatures, in the recorded order, with
+        the features computed per chunk by featurizeMany. The agent learns
+        the same as if it had observed the transitions in train_game, without
+        simulating the game. Returns the number of transitions observed.
+
+        The rewards are converted to agent.reward_values() if it differs from
+        the recording agent's (see rewardsFor).
+    """
+    observe = agent.observeFeatures
+    wanted = agent.reward_values()
+    count = 0
+    for n in range(passes):
+        for header, states, actions, rewards, ends, last in readChunks(path):
+            agent.actionRepeat = header['actionRepeat']
+            rewards = rewardsFor(rewards, header['rewardValues'], wanted, header['actionRepeat'])
+            features = featurizeMany(agent, states)
+            features.append(None if last is None else agent.featurize(last))
+            ends = ends.tolist()
+            for i, (f1, a, r, end) in enumerate(zip(features, actions.tolist(), rewards.tolist(), ends)):
+                observe(f1, a, r, None if end else features[i + 1], end)
+            count += len(ends)
+    return count